@@ -0,0 +1,168 @@
+"""Admission control for expensive admin routes.
+
+Each route class (see config.ROUTE_CLASS_DEFAULTS) gets a concurrency limit
+with a bounded wait queue, a per-transaction Postgres statement_timeout and a
+row cap. Waiting happens on the event loop (no worker thread or DB connection
+is held while queued). Overload is answered with 429 (queue full) or 503
+(queue wait timed out / statement timeout), both with Retry-After.
+
+FastAPI tears yield dependencies down before a streaming body is sent, so
+streaming endpoints return `held_streaming_response(...)` to keep their slot
+until the last chunk has gone out (or the client disconnected).
+"""
+
+from __future__ import annotations
+import asyncio
+import math
+import time
+from typing import Dict, Optional
+
+from fastapi import Depends, Header, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from .auth import check_auth
+from .config import ROUTE_CLASS_DEFAULTS, route_limits
+from .db import get_session, get_read_session
+
+
+class RouteLimiter:
+    def __init__(self, name: str, concurrency: int, queue: int, queue_timeout: float):
+        self.name = name
+        self.concurrency = max(1, concurrency)
+        self.queue = max(0, queue)
+        self.queue_timeout = queue_timeout
+        self._sem = asyncio.Semaphore(self.concurrency)
+        self.in_flight = 0
+        self.queued = 0
+        self.admitted = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+        self.wait_seconds_total = 0.0
+
+    def _retry_after(self) -> Dict[str, str]:
+        return {"Retry-After": str(max(1, math.ceil(self.queue_timeout)))}
+
+    async def acquire(self) -> None:
+        if not self._sem.locked() and not self.queued:
+            await self._sem.acquire()  # free slot: returns without suspending
+        elif self.queued >= self.queue:
+            self.rejected_queue_full += 1
+            raise HTTPException(status_code=429, detail=f"Too many concurrent {self.name} requests", headers=self._retry_after())
+        else:
+            self.queued += 1
+            t0 = time.monotonic()
+            try:
+                await asyncio.wait_for(self._sem.acquire(), timeout=self.queue_timeout)
+            except asyncio.TimeoutError:
+                self.rejected_timeout += 1
+                raise HTTPException(status_code=503, detail=f"{self.name} capacity busy, try again later", headers=self._retry_after())
+            finally:
+                self.queued -= 1
+                self.wait_seconds_total += time.monotonic() - t0
+        self.in_flight += 1
+        self.admitted += 1
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        self._sem.release()
+
+    def snapshot(self) -> dict:
+        return {
+            "concurrency": self.concurrency,
+            "queue": self.queue,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "admitted": self.admitted,
+            "rejected_queue_full": self.rejected_queue_full,
+            "rejected_timeout": self.rejected_timeout,
+            "wait_seconds_total": round(self.wait_seconds_total, 3),
+        }
+
+
+class _Lease:
+    """One admitted request's slot; released exactly once."""
+
+    def __init__(self, limiter: RouteLimiter):
+        self.limiter = limiter
+        self.held_by_response = False
+        self._released = False
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            self.limiter.release()
+
+
+class _HeldStreamingResponse(StreamingResponse):
+    def __init__(self, content, lease: _Lease, **kwargs):
+        super().__init__(content, **kwargs)
+        self._lease = lease
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self._lease.release()
+
+
+def held_streaming_response(request: Request, content, **kwargs) -> StreamingResponse:
+    """StreamingResponse that keeps the request's admission slot until it is sent."""
+    lease: Optional[_Lease] = getattr(request.state, "admission_lease", None)
+    if lease is None:
+        return StreamingResponse(content, **kwargs)
+    lease.held_by_response = True
+    return _HeldStreamingResponse(content, lease, **kwargs)
+
+
+LIMITS = {name: route_limits(name) for name in ROUTE_CLASS_DEFAULTS}
+LIMITERS = {
+    name: RouteLimiter(name, lim["concurrency"], lim["queue"], lim["queue_timeout"])
+    for name, lim in LIMITS.items()
+}
+STATEMENT_TIMEOUTS = {"count": 0}
+
+
+def max_rows(route_class: str, requested: int) -> int:
+    """Clamp a client-supplied `limit` to the route class cap."""
+    return max(1, min(int(requested), LIMITS[route_class]["max_rows"]))
+
+
+def _set_statement_timeout(db: Session, ms: int) -> None:
+    if ms > 0 and db.get_bind().dialect.name == "postgresql":
+        # is_local=true: applies to this request's transaction only.
+        db.execute(text("SELECT set_config('statement_timeout', :ms, true)"), {"ms": str(ms)})
+
+
+def limited_session(route_class: str, primary: bool = False):
+    """Dependency factory: admit the request for `route_class`, then hand out a
+    session (read replica unless `primary`) with the class statement_timeout."""
+    limiter = LIMITERS[route_class]
+    timeout_ms = LIMITS[route_class]["statement_timeout_ms"]
+
+    async def dependency(
+        request: Request,
+        db: Session = Depends(get_session if primary else get_read_session),
+        authorization: Optional[str] = Header(default=None),
+    ):
+        check_auth(authorization)  # don't let unauthenticated calls occupy slots
+        await limiter.acquire()
+        lease = request.state.admission_lease = _Lease(limiter)
+        try:
+            await run_in_threadpool(_set_statement_timeout, db, timeout_ms)
+            yield db
+        finally:
+            await run_in_threadpool(db.close)
+            if not lease.held_by_response:
+                lease.release()
+
+    return dependency
+
+
+def admission_metrics() -> dict:
+    return {
+        "routes": {name: lim.snapshot() for name, lim in LIMITERS.items()},
+        "statement_timeouts": STATEMENT_TIMEOUTS["count"],
+    }
@@ -0,0 +1,14 @@
+from __future__ import annotations
+from typing import Optional
+from fastapi import HTTPException
+
+from .config import SAVE_API_KEY
+
+def check_auth(authorization: Optional[str]) -> None:
+    if not SAVE_API_KEY:
+        return
+    if not authorization or not authorization.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail="Missing Bearer token")
+    token = authorization.replace("Bearer ", "", 1).strip()
+    if token != SAVE_API_KEY:
+        raise HTTPException(status_code=403, detail="Invalid token")
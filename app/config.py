@@ -5,11 +5,73 @@ from dotenv import load_dotenv
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL", "").strip()
+# Optional read-only replica for research/admin reads; empty = use the primary.
+DATABASE_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL", "").strip()
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "0"))  # 0 = server default
+REPLICA_POOL_SIZE = int(os.getenv("REPLICA_POOL_SIZE", "5"))
+REPLICA_MAX_OVERFLOW = int(os.getenv("REPLICA_MAX_OVERFLOW", "5"))
+REPLICA_STATEMENT_TIMEOUT_MS = int(os.getenv("REPLICA_STATEMENT_TIMEOUT_MS", "60000"))
+# Route to the primary when the replica is further behind than this (0 = no bound).
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "0"))
+REPLICA_CHECK_INTERVAL_SECONDS = float(os.getenv("REPLICA_CHECK_INTERVAL_SECONDS", "5"))
+# Bounds the health probe / new connections when the replica host is unreachable.
+REPLICA_CONNECT_TIMEOUT_SECONDS = int(os.getenv("REPLICA_CONNECT_TIMEOUT_SECONDS", "3"))
 SAVE_API_KEY = os.getenv("SAVE_API_KEY", "").strip() or None
 SAVE_LAMBDA = float(os.getenv("SAVE_LAMBDA", "0.8"))
 
+# "jsonb" (key/value object per row) or "packed" (float32 vector laid out by
+# questionnaire schema_version, see responses_codec). Run scripts/migrate.py
+# before switching an existing database to "packed".
+RESPONSES_STORAGE = os.getenv("SAVE_RESPONSES_STORAGE", "jsonb").strip().lower()
+
+# Incremental export: only emit changes older than this (and than the oldest
+# open write transaction, see crud._settled), so transactions that started
+# earlier but commit later are not skipped by the watermark.
+CHANGEFEED_SETTLE_SECONDS = float(os.getenv("CHANGEFEED_SETTLE_SECONDS", "60"))
+# Must match scripts/cleanup.py; cursors older than this need a full re-sync.
+TOMBSTONE_RETENTION_DAYS = int(os.getenv("TOMBSTONE_RETENTION_DAYS", "35"))
+
+# Nearest-neighbour search over capital/risk vectors (app/similarity.py).
+SIMILARITY_K_MIN = int(os.getenv("SIMILARITY_K_MIN", "5"))  # k-anonymity floor
+SIMILARITY_K_MAX = int(os.getenv("SIMILARITY_K_MAX", "1000"))
+SIMILARITY_REFRESH_SECONDS = float(os.getenv("SIMILARITY_REFRESH_SECONDS", "30"))
+SIMILARITY_PRELOAD = os.getenv("SIMILARITY_PRELOAD", "0").strip() in ("1", "true", "yes")
+
+# Monte Carlo uncertainty on /diagnose?uncertainty=true (app/uncertainty.py).
+UNCERTAINTY_SAMPLES_DEFAULT = int(os.getenv("UNCERTAINTY_SAMPLES_DEFAULT", "2000"))
+UNCERTAINTY_SAMPLES_MAX = int(os.getenv("UNCERTAINTY_SAMPLES_MAX", "20000"))
+UNCERTAINTY_COHORT_ROWS = int(os.getenv("UNCERTAINTY_COHORT_ROWS", "20000"))  # recent consented rows
+UNCERTAINTY_COHORT_MIN = int(os.getenv("UNCERTAINTY_COHORT_MIN", "30"))  # else fall back to all sectors
+UNCERTAINTY_COHORT_TTL_SECONDS = float(os.getenv("UNCERTAINTY_COHORT_TTL_SECONDS", "3600"))
+
+# On-demand request profiling via X-Save-Profile (app/profiling.py).
+SAVE_PROFILE_INTERVAL_MS = float(os.getenv("SAVE_PROFILE_INTERVAL_MS", "5"))
+SAVE_PROFILE_KEEP = int(os.getenv("SAVE_PROFILE_KEEP", "20"))
+SAVE_PROFILE_DIR = os.getenv("SAVE_PROFILE_DIR", "").strip()  # also write reports here
+
+# Admission control for expensive admin routes (app/admission.py). Keep the sum
+# of concurrencies below the primary pool (DB_POOL_SIZE + DB_MAX_OVERFLOW) so
+# public submissions always find a connection.
+ROUTE_CLASS_DEFAULTS = {
+    "export":  {"concurrency": 2, "queue": 4,  "queue_timeout": 10.0, "statement_timeout_ms": 120000, "max_rows": 200000},
+    "stats":   {"concurrency": 3, "queue": 8,  "queue_timeout": 10.0, "statement_timeout_ms": 30000,  "max_rows": 200000},
+    "profile": {"concurrency": 4, "queue": 16, "queue_timeout": 5.0,  "statement_timeout_ms": 5000,   "max_rows": 1000},
+}
+
 CAPS = ["S","H","C","E","I"]
 
+def route_limits(route_class: str) -> dict:
+    """Defaults for a route class, overridable via SAVE_LIMIT_<CLASS>_<SETTING> (e.g. SAVE_LIMIT_EXPORT_CONCURRENCY)."""
+    out = dict(ROUTE_CLASS_DEFAULTS[route_class])
+    for k, v in out.items():
+        env = os.getenv(f"SAVE_LIMIT_{route_class.upper()}_{k.upper()}")
+        if env:
+            out[k] = type(v)(env)
+    return out
+
 def weights_for(meta: dict) -> dict:
     sector = str(meta.get("sector","")).upper()
     profession = str(meta.get("profession","")).lower()
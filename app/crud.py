@@ -1,15 +1,29 @@
 from __future__ import annotations
 import uuid
-from sqlalchemy.orm import Session
-from .models_db import SaveAssessment
+from datetime import datetime, timedelta
+from sqlalchemy import tuple_, func, select, table, column, literal_column, and_
+from sqlalchemy.orm import Session, defer
+from .config import RESPONSES_STORAGE
+from .models_db import SaveAssessment, SaveAssessmentTombstone
+from .responses_codec import current_schema_version, encode
+
+# Research queries never need the raw answers; skip them (and their TOAST reads).
+SKIP_RESPONSES = (defer(SaveAssessment.responses_norm), defer(SaveAssessment.responses_vec))
 
 def create_assessment(db: Session, profile_id: str | None, consent_research: bool, meta_public: dict, responses_norm: dict, results: dict) -> SaveAssessment:
     pid = profile_id or str(uuid.uuid4())
+    schema_version = None
+    responses_vec = None
+    if RESPONSES_STORAGE == "packed":
+        schema_version = current_schema_version()
+        responses_vec, responses_norm = encode(responses_norm, schema_version)
     obj = SaveAssessment(
         profile_id=pid,
         consent_research=consent_research,
         meta_public=meta_public or {},
         responses_norm=responses_norm or {},
+        schema_version=schema_version,
+        responses_vec=responses_vec,
         results=results or {},
     )
     db.add(obj)
@@ -23,8 +37,96 @@ def get_assessment(db: Session, assessment_id: str) -> SaveAssessment | None:
 def list_assessments_for_export(db: Session, limit: int = 50000):
     return (
         db.query(SaveAssessment)
+        .options(*SKIP_RESPONSES)
         .filter(SaveAssessment.consent_research == True)
         .order_by(SaveAssessment.created_at.asc())
         .limit(limit)
         .all()
     )
+
+def list_profile_history(db: Session, profile_id: str, after: tuple[datetime, str] | None = None, limit: int = 100):
+    """Chronological compact projection of a profile's assessments.
+
+    Keyset-paginated on (created_at, assessment_id), served by
+    ix_save_assessments_profile_history. Returns (rows, previous_row) where
+    previous_row is the assessment just before the page (for deltas) or None.
+    """
+    A = SaveAssessment
+    cols = (
+        A.assessment_id,
+        A.created_at,
+        A.results["save_score"].label("save_score"),
+        A.results["capital_vector"].label("capital_vector"),
+        A.results["risk"]["V"].label("risk_V"),
+    )
+    key = tuple_(A.created_at, A.assessment_id)
+    q = db.query(*cols).filter(A.profile_id == profile_id)
+    prev = None
+    if after is not None:
+        q = q.filter(key > tuple_(*after))
+        prev = (
+            db.query(*cols)
+            .filter(A.profile_id == profile_id, key <= tuple_(*after))
+            .order_by(A.created_at.desc(), A.assessment_id.desc())
+            .first()
+        )
+    rows = q.order_by(A.created_at.asc(), A.assessment_id.asc()).limit(limit).all()
+    return rows, prev
+
+_pg_stat_activity = table("pg_stat_activity", column("xact_start"), column("backend_xid"), column("datname"))
+# Start of the oldest open transaction that has written something in this
+# database; its rows carry updated_at/deleted_at = now() = that start time.
+_OLDEST_WRITE_XACT = (
+    select(func.min(_pg_stat_activity.c.xact_start))
+    .where(_pg_stat_activity.c.backend_xid.isnot(None), _pg_stat_activity.c.datname == func.current_database())
+    .scalar_subquery()
+)
+
+def _settled(ts_col, settle_seconds: float):
+    """Change-feed horizon: older than `settle_seconds` and than any still-open
+    write transaction (e.g. a long cleanup.py run), so the watermark never moves
+    past rows that have yet to commit."""
+    return and_(
+        ts_col <= func.now() - timedelta(seconds=settle_seconds),
+        ts_col < func.coalesce(_OLDEST_WRITE_XACT, literal_column("'infinity'::timestamptz")),
+    )
+
+def list_changed_assessments(db: Session, after: tuple[datetime, str] | None, settle_seconds: float, limit: int = 10000):
+    """Consented assessments inserted/updated after the (updated_at, assessment_id) watermark."""
+    A = SaveAssessment
+    q = (
+        db.query(A)
+        .options(*SKIP_RESPONSES)
+        .filter(A.consent_research == True)
+        .filter(_settled(A.updated_at, settle_seconds))
+    )
+    if after is not None:
+        q = q.filter(tuple_(A.updated_at, A.assessment_id) > tuple_(*after))
+    return q.order_by(A.updated_at.asc(), A.assessment_id.asc()).limit(limit).all()
+
+def list_changed_vectors(db: Session, after: tuple[datetime, str] | None, settle_seconds: float, limit: int = 10000):
+    """Like list_changed_assessments, but only the JSON paths the similarity index needs."""
+    A = SaveAssessment
+    q = (
+        db.query(
+            A.assessment_id,
+            A.profile_id,
+            A.updated_at,
+            A.results["capital_vector"].label("capital_vector"),
+            A.results["risk"]["components"].label("risk_components"),
+            A.results["save_score"].label("save_score"),
+            A.results["risk"]["V"].label("risk_V"),
+        )
+        .filter(A.consent_research == True)
+        .filter(_settled(A.updated_at, settle_seconds))
+    )
+    if after is not None:
+        q = q.filter(tuple_(A.updated_at, A.assessment_id) > tuple_(*after))
+    return q.order_by(A.updated_at.asc(), A.assessment_id.asc()).limit(limit).all()
+
+def list_tombstones(db: Session, after: tuple[datetime, str] | None, settle_seconds: float, limit: int = 10000):
+    T = SaveAssessmentTombstone
+    q = db.query(T).filter(_settled(T.deleted_at, settle_seconds))
+    if after is not None:
+        q = q.filter(tuple_(T.deleted_at, T.assessment_id) > tuple_(*after))
+    return q.order_by(T.deleted_at.asc(), T.assessment_id.asc()).limit(limit).all()
@@ -1,29 +1,117 @@
 from __future__ import annotations
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, DeclarativeBase
-from .config import DATABASE_URL
+import threading
+import time
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session, sessionmaker, DeclarativeBase
+from .config import (
+    DATABASE_URL, DATABASE_REPLICA_URL,
+    DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_STATEMENT_TIMEOUT_MS,
+    REPLICA_POOL_SIZE, REPLICA_MAX_OVERFLOW, REPLICA_STATEMENT_TIMEOUT_MS,
+    REPLICA_MAX_LAG_SECONDS, REPLICA_CHECK_INTERVAL_SECONDS, REPLICA_CONNECT_TIMEOUT_SECONDS,
+)
 
 class Base(DeclarativeBase):
     pass
 
-def get_engine():
-    if not DATABASE_URL:
-        raise RuntimeError("DATABASE_URL is not set")
+def _make_engine(url: str, pool_size: int, max_overflow: int, statement_timeout_ms: int, connect_timeout: int = 0):
+    connect_args = {}
+    if statement_timeout_ms > 0 and url.startswith("postgresql"):
+        connect_args["options"] = f"-c statement_timeout={statement_timeout_ms}"
+    if connect_timeout > 0 and url.startswith("postgresql"):
+        connect_args["connect_timeout"] = connect_timeout
     return create_engine(
-        DATABASE_URL,
+        url,
         pool_pre_ping=True,
-        pool_size=5,
-        max_overflow=10,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        connect_args=connect_args,
         future=True,
     )
 
+def get_engine():
+    if not DATABASE_URL:
+        raise RuntimeError("DATABASE_URL is not set")
+    return _make_engine(DATABASE_URL, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_STATEMENT_TIMEOUT_MS)
+
+def get_read_engine():
+    """Engine for the read replica, or None when no replica is configured."""
+    if not DATABASE_REPLICA_URL:
+        return None
+    return _make_engine(
+        DATABASE_REPLICA_URL, REPLICA_POOL_SIZE, REPLICA_MAX_OVERFLOW, REPLICA_STATEMENT_TIMEOUT_MS,
+        connect_timeout=REPLICA_CONNECT_TIMEOUT_SECONDS,
+    )
+
 ENGINE = None
 SessionLocal = None
+READ_ENGINE = None
+ReadSessionLocal = None
 
 def init_db():
-    global ENGINE, SessionLocal
+    global ENGINE, SessionLocal, READ_ENGINE, ReadSessionLocal
     ENGINE = get_engine()
     SessionLocal = sessionmaker(bind=ENGINE, autoflush=False, autocommit=False, future=True)
+    READ_ENGINE = get_read_engine()
+    if READ_ENGINE is not None:
+        ReadSessionLocal = sessionmaker(bind=READ_ENGINE, autoflush=False, autocommit=False, future=True)
+
+_PRIMARY_LSN_SQL = text("SELECT pg_current_wal_lsn()::text")
+
+# Seconds behind the primary; 0 when replay has reached the primary's current
+# WAL position (an idle primary does not count as lag). Comparing against the
+# primary, not the replica's own receive LSN, keeps a replica whose WAL receiver
+# has disconnected from reporting 0 forever. Without a primary LSN (primary
+# unreachable) the receive LSN is the best available reference.
+_LAG_SQL = text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_replay_lsn() >= COALESCE(CAST(:primary_lsn AS pg_lsn), pg_last_wal_receive_lsn()) THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+""")
+
+def _primary_lsn():
+    if ENGINE is None or ENGINE.dialect.name != "postgresql":
+        return None
+    try:
+        with ENGINE.connect() as conn:
+            return conn.execute(_PRIMARY_LSN_SQL).scalar()
+    except SQLAlchemyError:
+        return None
+
+_replica_state = {"checked_at": 0.0, "usable": False, "lag": None}
+_probe_lock = threading.Lock()
+
+def replica_status() -> dict:
+    """Cached replica health: reachable and within REPLICA_MAX_LAG_SECONDS.
+
+    Single-flight: when the cache expires one caller probes, concurrent callers
+    keep using the cached state instead of waiting on (or repeating) the probe.
+    """
+    if READ_ENGINE is None:
+        return {"usable": False, "lag": None}
+    if time.monotonic() - _replica_state["checked_at"] >= REPLICA_CHECK_INTERVAL_SECONDS and _probe_lock.acquire(blocking=False):
+        try:
+            _probe_replica()
+        finally:
+            _probe_lock.release()
+    return {"usable": _replica_state["usable"], "lag": _replica_state["lag"]}
+
+def _probe_replica() -> None:
+    if time.monotonic() - _replica_state["checked_at"] < REPLICA_CHECK_INTERVAL_SECONDS:
+        return  # another caller just finished a probe
+    primary_lsn = _primary_lsn()  # read first: replay must catch up to at least this
+    try:
+        with READ_ENGINE.connect() as conn:
+            lag = float(conn.execute(_LAG_SQL, {"primary_lsn": primary_lsn}).scalar() or 0.0)
+        usable = REPLICA_MAX_LAG_SECONDS <= 0 or lag <= REPLICA_MAX_LAG_SECONDS
+    except SQLAlchemyError:
+        lag, usable = None, False
+    _replica_state.update(checked_at=time.monotonic(), usable=usable, lag=lag)
+
+def is_replica(db: Session) -> bool:
+    return READ_ENGINE is not None and db.get_bind() is READ_ENGINE
 
 def get_session():
     if SessionLocal is None:
@@ -33,3 +121,25 @@ def get_session():
         yield db
     finally:
         db.close()
+
+def open_session(read: bool = False) -> Session:
+    """Standalone session for work outside a request dependency (caller closes it).
+
+    With `read`, uses the replica when configured, reachable and fresh enough.
+    """
+    if SessionLocal is None:
+        init_db()
+    factory = ReadSessionLocal if read and replica_status()["usable"] else SessionLocal
+    return factory()
+
+def get_read_session():
+    """Session for read-only research/admin queries.
+
+    Uses the replica when configured, reachable and fresh enough; otherwise
+    falls back to the primary.
+    """
+    db = open_session(read=True)
+    try:
+        yield db
+    finally:
+        db.close()
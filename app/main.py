@@ -1,40 +1,87 @@
 from __future__ import annotations
-from fastapi import FastAPI, Header, HTTPException, Depends
-from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi import FastAPI, Header, HTTPException, Depends, Request
+from fastapi.responses import StreamingResponse, JSONResponse, PlainTextResponse
 from typing import Optional
 import io, csv, json
+from datetime import datetime, timedelta, timezone
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.orm import Session
 
-from .config import SAVE_API_KEY
+from .config import (
+    DATABASE_URL, CHANGEFEED_SETTLE_SECONDS, TOMBSTONE_RETENTION_DAYS,
+    SIMILARITY_K_MIN, SIMILARITY_K_MAX, SIMILARITY_REFRESH_SECONDS, SIMILARITY_PRELOAD,
+    UNCERTAINTY_SAMPLES_DEFAULT, UNCERTAINTY_SAMPLES_MAX,
+)
 from .models_api import DiagnoseRequest, AssessmentCreateRequest
 from .questionnaire import load_schema
+from .auth import check_auth
+from .profiling import ProfilingMiddleware, ProfilingRoute, get_report, list_reports
+from .admission import limited_session, max_rows, admission_metrics, held_streaming_response, STATEMENT_TIMEOUTS
 from .save_engine import diagnose
-from .db import init_db, get_session, Base, get_engine
+from .db import init_db, get_session, open_session, is_replica, replica_status, Base, get_engine
 from . import models_db  # registers table model
-from .crud import create_assessment, get_assessment, list_assessments_for_export
+from .crud import (
+    create_assessment, get_assessment, list_assessments_for_export, list_profile_history,
+    list_changed_assessments, list_tombstones, SKIP_RESPONSES,
+)
+from .pagination import encode_cursor, decode_cursor, cursor_datetime
+from .responses_codec import decode_responses_norm
 from .profile_engine import build_profile
+from .similarity import SIMILARITY_INDEX, FEATURES, feature_row
+from .uncertainty import get_cohort_priors, diagnose_uncertainty
 
 app = FastAPI(title="SAVE Model API (with DB)", version="1.0")
-
-def check_auth(authorization: Optional[str]) -> None:
-    if not SAVE_API_KEY:
-        return
-    if not authorization or not authorization.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Missing Bearer token")
-    token = authorization.replace("Bearer ", "", 1).strip()
-    if token != SAVE_API_KEY:
-        raise HTTPException(status_code=403, detail="Invalid token")
+app.router.route_class = ProfilingRoute  # must precede route registration
+app.add_middleware(ProfilingMiddleware)
+
+@app.exception_handler(OperationalError)
+def db_operational_error(request: Request, exc: OperationalError):
+    # 57014 = query_canceled, i.e. the route class statement_timeout fired.
+    if getattr(exc.orig, "pgcode", None) == "57014":
+        STATEMENT_TIMEOUTS["count"] += 1
+        detail = "Query exceeded its time budget; narrow the request or retry later"
+    else:
+        detail = "Database unavailable"
+    return JSONResponse({"detail": detail}, status_code=503, headers={"Retry-After": "30"})
 
 @app.on_event("startup")
 def on_startup():
     init_db()
     engine = get_engine()
     Base.metadata.create_all(bind=engine)
+    if SIMILARITY_PRELOAD:
+        SIMILARITY_INDEX.start_refresher(open_session, SIMILARITY_REFRESH_SECONDS)
 
 @app.get("/v1/health")
 def health():
     return {"status": "ok"}
 
+@app.get("/v1/admin/metrics")
+def admin_metrics(authorization: Optional[str] = Header(default=None)):
+    check_auth(authorization)
+    return {"admission": admission_metrics(), "replica": replica_status()}
+
+@app.get("/v1/admin/profiles")
+def admin_profiles(authorization: Optional[str] = Header(default=None)):
+    check_auth(authorization)
+    return {"profiles": list_reports()}
+
+@app.get("/v1/admin/profiles/{profile_run_id}")
+def admin_profile_report(profile_run_id: str, authorization: Optional[str] = Header(default=None)):
+    check_auth(authorization)
+    item = get_report(profile_run_id)
+    if not item:
+        raise HTTPException(status_code=404, detail="Not found")
+    return item["report"]
+
+@app.get("/v1/admin/profiles/{profile_run_id}/folded")
+def admin_profile_folded(profile_run_id: str, authorization: Optional[str] = Header(default=None)):
+    check_auth(authorization)
+    item = get_report(profile_run_id)
+    if not item:
+        raise HTTPException(status_code=404, detail="Not found")
+    return PlainTextResponse(item["folded"])
+
 @app.get("/v1/save/questionnaire")
 def questionnaire(lang: str = "en"):
     schema = load_schema()
@@ -43,9 +90,25 @@ def questionnaire(lang: str = "en"):
     return schema
 
 @app.post("/v1/save/diagnose")
-def save_diagnose(req: DiagnoseRequest, authorization: Optional[str] = Header(default=None)):
+def save_diagnose(
+    req: DiagnoseRequest,
+    uncertainty: bool = False,
+    samples: int = UNCERTAINTY_SAMPLES_DEFAULT,
+    authorization: Optional[str] = Header(default=None),
+):
     check_auth(authorization)
-    return diagnose(req.meta, req.responses)
+    out = diagnose(req.meta, req.responses)
+    if uncertainty:
+        samples = max(100, min(int(samples), UNCERTAINTY_SAMPLES_MAX))
+        out["uncertainty"] = diagnose_uncertainty(
+            req.meta,
+            out["responses_norm"],
+            out["bottlenecks"],
+            # Compute-only otherwise: a database is only touched for cohort priors.
+            get_cohort_priors((lambda: open_session(read=True)) if DATABASE_URL else None),
+            samples=samples,
+        )
+    return out
 
 @app.post("/v1/save/assessments")
 def create_save_assessment(
@@ -67,6 +130,8 @@ def create_save_assessment(
         responses_norm=responses_norm,
         results=results,
     )
+    if obj.consent_research:
+        SIMILARITY_INDEX.add(obj.assessment_id, obj.profile_id, obj.results)
 
     return {
         "assessment_id": obj.assessment_id,
@@ -74,7 +139,7 @@ def create_save_assessment(
         "created_at": obj.created_at.isoformat(),
         "consent_research": obj.consent_research,
         "meta_public": obj.meta_public,
-        "responses_norm": obj.responses_norm,
+        "responses_norm": decode_responses_norm(obj),
         "results": obj.results,
     }
 
@@ -94,21 +159,73 @@ def read_save_assessment(
         "created_at": obj.created_at.isoformat(),
         "consent_research": obj.consent_research,
         "meta_public": obj.meta_public,
-        "responses_norm": obj.responses_norm,
+        "responses_norm": decode_responses_norm(obj),
         "results": obj.results,
     }
 
 
+@app.get("/v1/save/assessments/{assessment_id}/similar")
+def similar_assessments(
+    assessment_id: str,
+    k: int = 20,
+    db: Session = Depends(limited_session("stats", primary=True)),  # primary: the index follows the change-feed watermark
+    authorization: Optional[str] = Header(default=None),
+):
+    # Admin-only. Returns k-anonymous aggregates of the k nearest consented
+    # respondents (other profiles) in capital + risk-component space.
+    check_auth(authorization)
+    # k is bucketed to multiples of k_min (and so is the neighbour set actually
+    # aggregated): two answers for the same target then differ by >= k_min rows,
+    # so differencing them can't isolate a single neighbour.
+    if int(k) < SIMILARITY_K_MIN:
+        raise HTTPException(status_code=400, detail=f"k must be >= {SIMILARITY_K_MIN}")
+    k = min(int(k), SIMILARITY_K_MAX) // SIMILARITY_K_MIN * SIMILARITY_K_MIN
+    k = max(k, SIMILARITY_K_MIN)
+
+    idx = SIMILARITY_INDEX
+    idx.start_refresher(open_session, SIMILARITY_REFRESH_SECONDS)  # no-op once running
+    if not idx.loaded:
+        detail = "Similarity index is loading, try again shortly"
+        if idx.last_error:
+            detail += f" (last attempt failed: {idx.last_error})"
+        raise HTTPException(status_code=503, detail=detail, headers={"Retry-After": "10"})
+
+    hit = idx.vector_for(assessment_id)
+    if hit is not None:
+        q, pcode = hit
+    else:
+        obj = get_assessment(db, assessment_id)
+        if not obj:
+            raise HTTPException(status_code=404, detail="Not found")
+        q = feature_row(obj.results or {})[0]
+        pcode = idx.profile_code(obj.profile_id)
+
+    X, aux = idx.query(q, k, exclude_profile=pcode)
+    n = len(X) // SIMILARITY_K_MIN * SIMILARITY_K_MIN
+    neighbours = idx.aggregate(X[:n], aux[:n], q) if n else None
+    return {
+        "assessment_id": assessment_id,
+        "k": k,
+        "k_min": SIMILARITY_K_MIN,
+        "features": FEATURES,
+        "index_size": len(idx),
+        "neighbours": neighbours,
+    }
+
 @app.get("/v1/save/profile/{assessment_id}")
 def get_profile(
     assessment_id: str,
     lang: str = "en",
-    db: Session = Depends(get_session),
+    db: Session = Depends(limited_session("profile")),
+    primary: Session = Depends(get_session),
     authorization: Optional[str] = Header(default=None),
 ):
     # Admin-only (API key). You can adjust later for end-user access.
     check_auth(authorization)
     obj = get_assessment(db, assessment_id)
+    if not obj and is_replica(db):
+        # Just-submitted assessments may not have replicated yet.
+        obj = get_assessment(primary, assessment_id)
     if not obj:
         raise HTTPException(status_code=404, detail="Not found")
     return build_profile(
@@ -119,6 +236,66 @@ def get_profile(
         lang=lang,
     )
 
+@app.get("/v1/save/profiles/{profile_id}/history")
+def profile_history(
+    profile_id: str,
+    cursor: Optional[str] = None,
+    limit: int = 100,
+    db: Session = Depends(limited_session("profile")),
+    authorization: Optional[str] = Header(default=None),
+):
+    check_auth(authorization)
+    limit = max_rows("profile", limit)
+
+    after = None
+    if cursor:
+        try:
+            c = decode_cursor(cursor)
+            after = (cursor_datetime(c, "created_at"), str(c["assessment_id"]))
+        except (ValueError, KeyError):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    rows, prev = list_profile_history(db, profile_id, after=after, limit=limit + 1)
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    def num(x):
+        return float(x) if isinstance(x, (int, float)) else None
+
+    def diff(a, b):
+        return round(a - b, 6) if a is not None and b is not None else None
+
+    def project(r):
+        cv = r.capital_vector or {}
+        return {
+            "assessment_id": r.assessment_id,
+            "created_at": r.created_at.isoformat(),
+            "save_score": num(r.save_score),
+            "capital_vector": {c: num(cv.get(c)) for c in ["S","H","C","E","I"]},
+            "risk_V": num(r.risk_V),
+        }
+
+    prev_item = project(prev) if prev is not None else None
+    items = []
+    for r in rows:
+        item = project(r)
+        item["delta"] = None
+        if prev_item is not None:
+            item["delta"] = {
+                "save_score": diff(item["save_score"], prev_item["save_score"]),
+                "capital_vector": {c: diff(item["capital_vector"][c], prev_item["capital_vector"][c]) for c in ["S","H","C","E","I"]},
+                "risk_V": diff(item["risk_V"], prev_item["risk_V"]),
+            }
+        items.append(item)
+        prev_item = item
+
+    next_cursor = None
+    if has_more and rows:
+        last = rows[-1]
+        next_cursor = encode_cursor({"created_at": last.created_at, "assessment_id": last.assessment_id})
+
+    return {"profile_id": profile_id, "count": len(items), "items": items, "next_cursor": next_cursor}
+
 @app.get("/v1/save/research/stats")
 def research_stats(
     group_by: str = "sector",
@@ -126,10 +303,11 @@ def research_stats(
     date_to: Optional[str] = None,
     k_min: int = 5,
     limit: int = 50000,
-    db: Session = Depends(get_session),
+    db: Session = Depends(limited_session("stats")),
     authorization: Optional[str] = Header(default=None),
 ):
     check_auth(authorization)
+    limit = max_rows("stats", limit)
 
     groups = [g.strip() for g in group_by.split(",") if g.strip()]
     allowed = {"sector","employment","years_experience"}
@@ -137,13 +315,13 @@ def research_stats(
         if g not in allowed:
             raise HTTPException(status_code=400, detail=f"Invalid group_by field: {g}")
 
-    q = db.query(models_db.SaveAssessment).filter(models_db.SaveAssessment.consent_research == True)
+    q = db.query(models_db.SaveAssessment).options(*SKIP_RESPONSES).filter(models_db.SaveAssessment.consent_research == True)
     if date_from:
         q = q.filter(models_db.SaveAssessment.created_at >= date_from)
     if date_to:
         q = q.filter(models_db.SaveAssessment.created_at < date_to)
 
-    rows = q.order_by(models_db.SaveAssessment.created_at.asc()).limit(limit).all()
+    rows = q.order_by(models_db.SaveAssessment.created_at.asc()).limit(limit).yield_per(5000)
 
     def group_key(meta: dict):
         meta = meta or {}
@@ -191,7 +369,7 @@ def research_stats_csv(
     date_to: Optional[str] = None,
     k_min: int = 5,
     limit: int = 50000,
-    db: Session = Depends(get_session),
+    db: Session = Depends(limited_session("stats")),
     authorization: Optional[str] = Header(default=None),
 ):
     check_auth(authorization)
@@ -233,26 +411,28 @@ def research_stats_csv(
         headers={"Content-Disposition":"attachment; filename=save_stats.csv"},
     )
 
+def export_record(r) -> dict:
+    return {
+        "assessment_id": r.assessment_id,
+        "profile_id": r.profile_id,
+        "created_at": r.created_at.isoformat(),
+        "meta_public": r.meta_public,
+        "results": r.results,
+    }
+
 @app.get("/v1/save/research/export")
 def research_export(
+    request: Request,
     format: str = "csv",
     limit: int = 50000,
-    db: Session = Depends(get_session),
+    db: Session = Depends(limited_session("export")),
     authorization: Optional[str] = Header(default=None),
 ):
     check_auth(authorization)
-    rows = list_assessments_for_export(db, limit=limit)
+    rows = list_assessments_for_export(db, limit=max_rows("export", limit))
 
     if format.lower() == "json":
-        out = []
-        for r in rows:
-            out.append({
-                "assessment_id": r.assessment_id,
-                "profile_id": r.profile_id,
-                "created_at": r.created_at.isoformat(),
-                "meta_public": r.meta_public,
-                "results": r.results,
-            })
+        out = [export_record(r) for r in rows]
         return JSONResponse({"count": len(out), "records": out})
 
     def stream():
@@ -279,4 +459,67 @@ def research_export(
             yield buffer.getvalue()
             buffer.seek(0); buffer.truncate(0)
 
-    return StreamingResponse(stream(), media_type="text/csv", headers={"Content-Disposition":"attachment; filename=save_export.csv"})
+    # The export slot stays taken until the body has been streamed to the client.
+    return held_streaming_response(
+        request, stream(), media_type="text/csv", headers={"Content-Disposition":"attachment; filename=save_export.csv"},
+    )
+
+@app.get("/v1/save/research/changes")
+def research_changes(
+    cursor: Optional[str] = None,
+    limit: int = 10000,
+    db: Session = Depends(limited_session("export", primary=True)),  # primary: replica lag would break the watermark
+    authorization: Optional[str] = Header(default=None),
+):
+    """Incremental export: consented rows inserted/updated and tombstones of
+    deleted rows since `cursor`. Start without a cursor, then always pass the
+    returned `next_cursor` (also when `has_more` is false) on the next sync."""
+    check_auth(authorization)
+    limit = max_rows("export", limit)
+
+    upsert_after = delete_after = None
+    if cursor:
+        try:
+            c = decode_cursor(cursor)
+            if c.get("u_id") is not None:
+                upsert_after = (cursor_datetime(c, "u_at"), str(c["u_id"]))
+            if c.get("d_id") is not None:
+                delete_after = (cursor_datetime(c, "d_at"), str(c["d_id"]))
+            synced_at = cursor_datetime(c, "s_at")
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        # Tombstones past the retention window are purged; a consumer that has not
+        # synced since then may have missed deletes.
+        if TOMBSTONE_RETENTION_DAYS > 0:
+            horizon = datetime.now(timezone.utc) - timedelta(days=TOMBSTONE_RETENTION_DAYS)
+            if synced_at < horizon:
+                raise HTTPException(status_code=410, detail="Cursor expired; run a full export and restart the feed")
+
+    rows = list_changed_assessments(db, upsert_after, CHANGEFEED_SETTLE_SECONDS, limit=limit)
+    tombs = list_tombstones(db, delete_after, CHANGEFEED_SETTLE_SECONDS, limit=limit)
+
+    upserts = []
+    for r in rows:
+        rec = export_record(r)
+        rec["updated_at"] = r.updated_at.isoformat()
+        upserts.append(rec)
+    deletes = [{"assessment_id": t.assessment_id, "deleted_at": t.deleted_at.isoformat()} for t in tombs]
+
+    nxt = {"s_at": datetime.now(timezone.utc) - timedelta(seconds=CHANGEFEED_SETTLE_SECONDS)}
+    if rows:
+        nxt.update(u_at=rows[-1].updated_at, u_id=rows[-1].assessment_id)
+    elif upsert_after is not None:
+        nxt.update(u_at=upsert_after[0], u_id=upsert_after[1])
+    if tombs:
+        nxt.update(d_at=tombs[-1].deleted_at, d_id=tombs[-1].assessment_id)
+    elif delete_after is not None:
+        nxt.update(d_at=delete_after[0], d_id=delete_after[1])
+
+    return {
+        "count_upserts": len(upserts),
+        "count_deletes": len(deletes),
+        "upserts": upserts,
+        "deletes": deletes,
+        "has_more": len(rows) == limit or len(tombs) == limit,
+        "next_cursor": encode_cursor(nxt),
+    }
@@ -1,20 +1,42 @@
 from __future__ import annotations
 import uuid
 from datetime import datetime
-from sqlalchemy import String, Boolean, DateTime
+from sqlalchemy import String, Boolean, DateTime, LargeBinary, Index, func
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import Mapped, mapped_column
 from .db import Base
 
 class SaveAssessment(Base):
     __tablename__ = "save_assessments"
+    __table_args__ = (
+        # Per-profile history keyset scans; also serves plain profile_id lookups.
+        Index("ix_save_assessments_profile_history", "profile_id", "created_at", "assessment_id"),
+        Index("ix_save_assessments_changes", "updated_at", "assessment_id"),
+    )
 
     assessment_id: Mapped[str] = mapped_column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    profile_id: Mapped[str] = mapped_column(String(36), index=True)
+    profile_id: Mapped[str] = mapped_column(String(36))
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=datetime.utcnow, index=True)
+    # Change-feed watermark. Set from the database clock so every writer (API,
+    # cleanup SQL) shares one timeline; raw SQL updates must set it explicitly.
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
     consent_research: Mapped[bool] = mapped_column(Boolean, default=True)
 
     meta_public: Mapped[dict] = mapped_column(JSONB, default=dict)
     responses_norm: Mapped[dict] = mapped_column(JSONB, default=dict)
+    # Packed float32 answers (NaN = missing); when set, responses_norm only holds extras.
+    schema_version: Mapped[str | None] = mapped_column(String(64), nullable=True)
+    responses_vec: Mapped[bytes | None] = mapped_column(LargeBinary, nullable=True)
     results: Mapped[dict] = mapped_column(JSONB, default=dict)
+
+
+class SaveAssessmentTombstone(Base):
+    """Deleted consented assessments, so incremental exports can propagate deletes."""
+    __tablename__ = "save_assessment_tombstones"
+    __table_args__ = (
+        Index("ix_save_assessment_tombstones_changes", "deleted_at", "assessment_id"),
+    )
+
+    assessment_id: Mapped[str] = mapped_column(String(36), primary_key=True)
+    deleted_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
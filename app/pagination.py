@@ -0,0 +1,30 @@
+from __future__ import annotations
+import base64
+import json
+from datetime import datetime, timezone
+from typing import Any, Dict
+
+def encode_cursor(payload: Dict[str, Any]) -> str:
+    """Opaque, URL-safe cursor. datetimes are stored as ISO strings."""
+    data = {k: (v.isoformat() if isinstance(v, datetime) else v) for k, v in payload.items()}
+    raw = json.dumps(data, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str) -> Dict[str, Any]:
+    """Inverse of encode_cursor. Raises ValueError on malformed input."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        data = json.loads(raw)
+    except Exception as e:
+        raise ValueError("Invalid cursor") from e
+    if not isinstance(data, dict):
+        raise ValueError("Invalid cursor")
+    return data
+
+def cursor_datetime(data: Dict[str, Any], key: str) -> datetime:
+    """tz-aware datetime from a cursor field; naive values are taken as UTC."""
+    try:
+        dt = datetime.fromisoformat(data[key])
+    except (KeyError, TypeError, ValueError) as e:
+        raise ValueError("Invalid cursor") from e
+    return dt if dt.tzinfo is not None else dt.replace(tzinfo=timezone.utc)
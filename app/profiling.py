@@ -0,0 +1,315 @@
+"""On-demand profiling of single requests (admin-only).
+
+Send `X-Save-Profile: sample` (or `1`) or `X-Save-Profile: cprofile` with a
+valid admin token and that one request is profiled:
+
+- `sample`: a sampler thread records the endpoint thread's stack every
+  SAVE_PROFILE_INTERVAL_MS and produces folded stacks (flamegraph.pl /
+  speedscope / inferno compatible).
+- `cprofile`: the endpoint runs under cProfile; the report carries the top of
+  the pstats table. From Python 3.12 cProfile is process-wide (sys.monitoring):
+  calls made by other requests' threads meanwhile are included, and only one
+  profiler can be active. Runs are therefore serialized; a cprofile request
+  arriving while another is active is sampled instead (noted in the report).
+
+Both modes record every SQL statement with its duration. The response carries
+`X-Save-Profile-Id`; reports are kept in memory (last SAVE_PROFILE_KEEP) and
+optionally written to SAVE_PROFILE_DIR, and are served under /v1/admin/profiles.
+
+Without the header the cost is a header scan in the middleware and one
+ContextVar lookup per endpoint call; SQL hooks are only attached while a
+profiled request is in flight.
+"""
+
+from __future__ import annotations
+import asyncio
+import cProfile
+import functools
+import io
+import json
+import pstats
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from fastapi import HTTPException
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from .auth import check_auth
+from .config import SAVE_PROFILE_INTERVAL_MS, SAVE_PROFILE_KEEP, SAVE_PROFILE_DIR
+
+_MAX_STATEMENTS = 500
+_MAX_SQL_CHARS = 2000
+
+_current: ContextVar[Optional["ProfileRun"]] = ContextVar("save_profile_run", default=None)
+_reports: "deque[dict]" = deque(maxlen=SAVE_PROFILE_KEEP)
+_reports_lock = threading.Lock()
+
+
+class ProfileRun:
+    def __init__(self, mode: str, method: str, path: str):
+        self.id = uuid.uuid4().hex[:16]
+        self.mode = mode
+        self.method = method
+        self.path = path
+        self.status: Optional[int] = None
+        self.started = time.perf_counter()
+        self.endpoint_ms: Optional[float] = None
+        self.sql: List[dict] = []
+        self.sql_count = 0
+        self.sql_ms = 0.0
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.pstats_text: Optional[str] = None
+        self.note: Optional[str] = None
+        self.finished = False
+
+    def record_sql(self, statement: str, ms: float, rows: int) -> None:
+        self.sql_count += 1
+        self.sql_ms += ms
+        if len(self.sql) < _MAX_STATEMENTS:
+            self.sql.append({"sql": statement[:_MAX_SQL_CHARS], "ms": round(ms, 3), "rows": rows})
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {n}\n" for stack, n in self.stacks.most_common())
+
+    def report(self) -> dict:
+        return {
+            "id": self.id,
+            "mode": self.mode,
+            "method": self.method,
+            "path": self.path,
+            "status": self.status,
+            "wall_ms": round((time.perf_counter() - self.started) * 1000.0, 3),
+            "endpoint_ms": self.endpoint_ms,
+            "sql": {"count": self.sql_count, "total_ms": round(self.sql_ms, 3), "statements": self.sql},
+            "samples": self.samples,
+            "interval_ms": SAVE_PROFILE_INTERVAL_MS if self.mode == "sample" else None,
+            "pstats": self.pstats_text,
+            "note": self.note,
+        }
+
+
+# -- SQL hooks (attached only while at least one run is active) ---------------
+
+_hooks_lock = threading.Lock()
+_hooks_users = 0
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None and _current.get() is not None:
+        context._save_profile_t0 = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    run = _current.get()
+    t0 = getattr(context, "_save_profile_t0", None)
+    if run is None or t0 is None:
+        return
+    run.record_sql(statement, (time.perf_counter() - t0) * 1000.0, getattr(cursor, "rowcount", -1))
+
+
+def _attach_sql_hooks() -> None:
+    global _hooks_users
+    with _hooks_lock:
+        if _hooks_users == 0:
+            event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+            event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+        _hooks_users += 1
+
+
+def _detach_sql_hooks() -> None:
+    global _hooks_users
+    with _hooks_lock:
+        _hooks_users -= 1
+        if _hooks_users == 0:
+            event.remove(Engine, "before_cursor_execute", _before_cursor_execute)
+            event.remove(Engine, "after_cursor_execute", _after_cursor_execute)
+
+
+# -- endpoint wrapping ----------------------------------------------------------
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})".replace(";", ":")
+
+
+def _sample_thread(run: ProfileRun, ident: int, stop: threading.Event) -> None:
+    interval = SAVE_PROFILE_INTERVAL_MS / 1000.0
+    while not stop.wait(interval):
+        frame = sys._current_frames().get(ident)
+        stack = []
+        while frame is not None:
+            stack.append(_frame_label(frame))
+            frame = frame.f_back
+        if stack:
+            run.stacks[";".join(reversed(stack))] += 1
+            run.samples += 1
+
+
+_cprofile_lock = threading.Lock()
+
+
+def _run_sampled(run: ProfileRun, func, args, kwargs):
+    stop = threading.Event()
+    sampler = threading.Thread(
+        target=_sample_thread, args=(run, threading.get_ident(), stop), name=f"profile-{run.id}", daemon=True,
+    )
+    sampler.start()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        stop.set()
+        sampler.join()
+
+
+def _run_cprofile(run: ProfileRun, func, args, kwargs):
+    prof = cProfile.Profile()
+    try:
+        prof.enable()
+    except ValueError:  # another profiling tool holds sys.monitoring (3.12+)
+        run.mode, run.note = "sample", "cprofile unavailable (another profiler is active); sampled instead"
+        return _run_sampled(run, func, args, kwargs)
+    try:
+        return func(*args, **kwargs)
+    finally:
+        prof.disable()
+        buf = io.StringIO()
+        pstats.Stats(prof, stream=buf).sort_stats("cumulative").print_stats(60)
+        run.pstats_text = buf.getvalue()
+
+
+def _run_profiled(run: ProfileRun, func, args, kwargs):
+    t0 = time.perf_counter()
+    try:
+        if run.mode == "cprofile":
+            if _cprofile_lock.acquire(blocking=False):
+                try:
+                    return _run_cprofile(run, func, args, kwargs)
+                finally:
+                    _cprofile_lock.release()
+            run.mode, run.note = "sample", "another cprofile run was active; sampled instead"
+        return _run_sampled(run, func, args, kwargs)
+    finally:
+        run.endpoint_ms = round((time.perf_counter() - t0) * 1000.0, 3)
+
+
+def wrap_endpoint(func):
+    """Run `func` under the active profile run, if any (endpoints only)."""
+    if asyncio.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            run = _current.get()
+            if run is None:
+                return await func(*args, **kwargs)
+            # Coroutines share the event-loop thread: record wall time + SQL only.
+            t0 = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                run.endpoint_ms = round((time.perf_counter() - t0) * 1000.0, 3)
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        run = _current.get()
+        if run is None:
+            return func(*args, **kwargs)
+        return _run_profiled(run, func, args, kwargs)
+    return wrapper
+
+
+class ProfilingRoute(APIRoute):
+    """APIRoute whose endpoint call honours an active profile run."""
+
+    def get_route_handler(self):
+        self.dependant.call = wrap_endpoint(self.dependant.call)
+        return super().get_route_handler()
+
+
+# -- middleware + report store ---------------------------------------------------
+
+def _store(run: ProfileRun) -> None:
+    report = run.report()
+    folded = run.folded()
+    with _reports_lock:
+        _reports.append({"report": report, "folded": folded})
+    if SAVE_PROFILE_DIR:
+        out = Path(SAVE_PROFILE_DIR)
+        out.mkdir(parents=True, exist_ok=True)
+        (out / f"{run.id}.json").write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+        if folded:
+            (out / f"{run.id}.folded").write_text(folded, encoding="utf-8")
+
+
+def get_report(profile_id: str) -> Optional[Dict[str, Any]]:
+    with _reports_lock:
+        for item in _reports:
+            if item["report"]["id"] == profile_id:
+                return item
+    return None
+
+
+def list_reports() -> List[dict]:
+    with _reports_lock:
+        items = list(_reports)
+    return [
+        {k: it["report"][k] for k in ("id", "mode", "method", "path", "status", "wall_ms")}
+        | {"sql_count": it["report"]["sql"]["count"]}
+        for it in reversed(items)
+    ]
+
+
+class ProfilingMiddleware:
+    """Pure ASGI middleware: starts a ProfileRun for admin requests carrying X-Save-Profile."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        mode = authorization = None
+        for name, value in scope.get("headers", ()):
+            if name == b"x-save-profile":
+                mode = value.decode("latin-1").strip().lower()
+            elif name == b"authorization":
+                authorization = value.decode("latin-1")
+        if not mode or mode in ("0", "false", "no"):
+            return await self.app(scope, receive, send)
+        try:
+            check_auth(authorization)
+        except HTTPException:
+            return await self.app(scope, receive, send)
+
+        run = ProfileRun("cprofile" if mode == "cprofile" else "sample", scope.get("method", ""), scope.get("path", ""))
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                run.status = message.get("status")
+                message = dict(message)
+                message["headers"] = list(message.get("headers", [])) + [(b"x-save-profile-id", run.id.encode())]
+            elif message["type"] == "http.response.body" and not message.get("more_body", False):
+                finish()
+            await send(message)
+
+        def finish():
+            if not run.finished:
+                run.finished = True
+                _store(run)
+
+        _attach_sql_hooks()
+        token = _current.set(run)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            _detach_sql_hooks()
+            finish()
@@ -0,0 +1,100 @@
+"""Fixed-layout packed storage for `responses_norm`.
+
+Instead of a JSONB object that repeats every key name per row, answers are
+stored as a little-endian float32 vector whose slot order is given by the
+questionnaire `schema_version`. Missing answers are NaN. Keys that are not
+part of the layout (legacy / ad-hoc items) stay in the JSONB column as
+"extras", so nothing is lost.
+"""
+
+from __future__ import annotations
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+import numpy as np
+
+from .questionnaire import load_schema
+
+_DTYPE = np.dtype("<f4")
+
+# Layouts are frozen per schema_version: rows written under a version must stay
+# decodable after the questionnaire changes. When `schema_version` is bumped,
+# add the new layout here (append-only); never reorder an existing one.
+_FROZEN_LAYOUTS: Dict[str, Tuple[str, ...]] = {
+    "SAVER_MODEL_1_2_PDF_IMPORT_2026-02-08": (
+        "S_stock_help_quick", "S_stock_communities", "S_stock_collab_freq",
+        "S_stock_bridging", "S_stock_trust", "S_stock_info_opps",
+        "S_stock_crisis_support", "S_stock_mentors", "S_stock_gatekeepers",
+        "S_stock_weak_ties", "H_stock_market_fit", "H_stock_learning",
+        "H_stock_certifications", "H_stock_time_delivery", "H_stock_value_prop",
+        "H_stock_negotiate", "H_stock_digital", "H_stock_team_conflict",
+        "H_stock_documentation", "H_stock_underutilized", "C_stock_identity",
+        "C_stock_recognition", "C_stock_storytelling", "C_stock_spaces_access",
+        "C_stock_crossdiscipline", "C_stock_monetize", "C_stock_rights",
+        "C_stock_visibility", "C_stock_adapt", "B_CE_gatekeeping",
+        "E_stock_income_stability", "E_stock_buffer_3m", "E_stock_invest_networking",
+        "E_stock_invest_training", "E_stock_fair_pricing", "E_stock_project_continuity",
+        "E_stock_debt_limits", "E_to_I_tax_admin_capacity", "I_stock_programs_knowledge",
+        "I_stock_access_services", "I_to_E_funding", "I_stock_institutional_networks",
+        "I_stock_fair_treatment_trust", "I_stock_recognition_credibility", "I_stock_intermediaries_access",
+        "I_stock_digital_public_services", "B_institutional_complexity", "B_discrimination_exclusion",
+        "B_market_gatekeeping", "B_digital_divide", "R_precarity",
+        "R_burnout", "R_support_access", "R_shock_exposure",
+    ),
+}
+
+
+@lru_cache(maxsize=1)
+def current_schema_version() -> str:
+    return str(load_schema().get("schema_version", ""))
+
+
+@lru_cache(maxsize=None)
+def layout_for(schema_version: str) -> Tuple[str, ...]:
+    """Ordered response keys for a schema version (meta questions excluded)."""
+    if schema_version in _FROZEN_LAYOUTS:
+        return _FROZEN_LAYOUTS[schema_version]
+    schema = load_schema()
+    if schema_version != schema.get("schema_version"):
+        raise KeyError(f"Unknown questionnaire schema_version: {schema_version}")
+    return tuple(
+        q["key"] for q in schema.get("questions", [])
+        if (q.get("map") or {}).get("kind") != "meta"
+    )
+
+
+@lru_cache(maxsize=None)
+def _slots(schema_version: str) -> Dict[str, int]:
+    return {k: i for i, k in enumerate(layout_for(schema_version))}
+
+
+def encode(responses_norm: Dict[str, float], schema_version: str) -> Tuple[bytes, Dict[str, float]]:
+    """Pack normalized responses. Returns (vector bytes, extras not in the layout)."""
+    slots = _slots(schema_version)
+    vec = np.full(len(slots), np.nan, dtype=_DTYPE)
+    extras: Dict[str, float] = {}
+    for k, v in (responses_norm or {}).items():
+        i = slots.get(k)
+        if i is None:
+            extras[k] = v
+        else:
+            vec[i] = v
+    return vec.tobytes(), extras
+
+
+def decode(blob: bytes, schema_version: str, extras: Optional[Dict[str, float]] = None) -> Dict[str, float]:
+    keys = layout_for(schema_version)
+    vec = np.frombuffer(blob, dtype=_DTYPE)
+    if vec.shape[0] != len(keys):
+        raise ValueError(f"responses_vec has {vec.shape[0]} slots, layout {schema_version} has {len(keys)}")
+    vals = vec.astype(np.float64).round(6).tolist()
+    out = {k: v for k, v in zip(keys, vals) if v == v}  # NaN != NaN
+    if extras:
+        out.update(extras)
+    return out
+
+
+def decode_responses_norm(obj) -> Dict[str, float]:
+    """`responses_norm` of a SaveAssessment, whichever storage format it uses."""
+    if obj.responses_vec is None:
+        return obj.responses_norm or {}
+    return decode(obj.responses_vec, obj.schema_version, obj.responses_norm)
@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from typing import Dict, Any
+from typing import Dict, Any, List
 import numpy as np
 
 from .config import CAPS, SAVE_LAMBDA, weights_for, risk_alphas
@@ -189,9 +189,9 @@ def compute_T_B(normed: Dict[str, float]):
     return T, B
 
 
-def compute_risk(meta: Dict[str, Any], normed: Dict[str, float]) -> dict:
+def risk_weights(meta: Dict[str, Any]) -> Dict[str, float]:
     """
-    Compute composite risk score V using updated risk keys and weights.
+    Risk weights per RISK_KEYS.
 
     If config.risk_alphas(meta) exists and returns a dict, it is merged
     with DEFAULT_RISK_ALPHAS so missing new keys don't break the model.
@@ -207,6 +207,14 @@ def compute_risk(meta: Dict[str, Any], normed: Dict[str, float]) -> dict:
     s = sum(alphas.values())
     if s > 0:
         alphas = {k: v / s for k, v in alphas.items()}
+    return alphas
+
+
+def compute_risk(meta: Dict[str, Any], normed: Dict[str, float]) -> dict:
+    """
+    Compute composite risk score V using updated risk keys and weights.
+    """
+    alphas = risk_weights(meta)
 
     comps = {}
     V = 0.0
@@ -224,6 +232,68 @@ def compute_risk(meta: Dict[str, Any], normed: Dict[str, float]) -> dict:
     }
 
 
+def diagnose_batch(meta: Dict[str, Any], keys: List[str], X: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Vectorized core of `diagnose` for N response vectors at once.
+
+    X is (N, len(keys)) of normalized values with NaN for "not answered";
+    missing items are treated exactly as in the single-response path
+    (left out of stock/transfer means, 0 for barriers and risks).
+    Returns save_score (N,), capital_vector (N,5), V (N,), T (N,5,5) and
+    priority (N,5,5) as used for bottleneck ranking.
+    """
+    X = np.asarray(X, dtype=float)
+    N = X.shape[0]
+    col = {k: i for i, k in enumerate(keys)}
+    answered = ~np.isnan(X)
+    X0 = np.where(answered, X, 0.0)
+
+    def nanmean_cols(idx: List[int]) -> np.ndarray:
+        if not idx:
+            return np.zeros(N)
+        cnt = answered[:, idx].sum(axis=1)
+        return np.where(cnt > 0, X0[:, idx].sum(axis=1) / np.maximum(cnt, 1), 0.0)
+
+    cvec = np.zeros((N, 5))
+    for cap, pref in STOCK_PREFIX.items():
+        cvec[:, IDX[cap]] = nanmean_cols([i for k, i in col.items() if k.startswith(pref)])
+
+    T = np.zeros((N, 5, 5))
+    cells: Dict[tuple, List[int]] = {}
+    for k, (a, b) in T_MAP.items():
+        if k in col:
+            cells.setdefault((a, b), []).append(col[k])
+    for (a, b), idx in cells.items():
+        T[:, IDX[a], IDX[b]] = nanmean_cols(idx)
+
+    B = np.zeros((N, 5, 5))
+    for bk, affected in B_MAP.items():
+        if bk in col:
+            for (a, b) in affected:
+                B[:, IDX[a], IDX[b]] = np.maximum(B[:, IDX[a], IDX[b]], X0[:, col[bk]])
+
+    alphas = risk_weights(meta)
+    V = np.zeros(N)
+    for rk in RISK_KEYS:
+        if rk in col:
+            V += alphas.get(rk, 0.0) * X0[:, col[rk]]
+
+    w = weights_for(meta)
+    wvec = np.array([w[c] for c in CAPS], dtype=float)
+    Avec = cvec * wvec
+    T_eff = T * (1.0 - B)
+    flow_norm = np.abs(np.einsum("ni,nij->nj", Avec, T_eff)).sum(axis=1)
+    save_score = flow_norm - SAVE_LAMBDA * V
+
+    return {
+        "save_score": save_score,
+        "capital_vector": cvec,
+        "V": V,
+        "T": T,
+        "priority": Avec[:, :, None] * (1.0 - T_eff),
+    }
+
+
 def diagnose(meta: Dict[str, Any], responses: Dict[str, Any]) -> dict:
     normed = normalize_responses(responses)
 
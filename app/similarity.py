@@ -0,0 +1,258 @@
+"""In-memory nearest-neighbour index over consented capital/risk vectors.
+
+Each consented assessment becomes one float32 row: capital_vector (S,H,C,E,I)
+followed by the risk components, all on the same 0..1 scale. Rows live in one
+contiguous, amortized-growth matrix; queries are brute-force squared-L2 in
+fixed-size chunks (one GEMV per chunk plus a partial sort), which keeps memory
+flat and scales linearly to millions of rows.
+
+The index is filled from the change feed (`list_changed_vectors` /
+`list_tombstones`, projecting only the needed JSON paths), so it is refreshed
+incrementally: inserts, re-scored rows and retention deletes are applied
+without reloading. A background thread started on first use loads the index
+and then refreshes it periodically, applying each chunk under the lock, so
+searches never wait for the database. Only aggregates of
+the neighbours are ever returned, never their ids.
+"""
+
+from __future__ import annotations
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import numpy as np
+from sqlalchemy.orm import Session
+
+from .config import CAPS, CHANGEFEED_SETTLE_SECONDS
+from .crud import list_changed_vectors, list_tombstones
+from .save_engine import RISK_KEYS
+
+FEATURES = list(CAPS) + list(RISK_KEYS)
+_AUX = ["save_score", "risk_V"]
+_LOAD_CHUNK = 50000
+_QUERY_CHUNK = 1 << 18
+
+
+def _num(x, default):
+    return float(x) if isinstance(x, (int, float)) else default
+
+
+def _row(cv, comps, save_score, risk_V) -> Tuple[List[float], List[float]]:
+    cv = cv or {}
+    comps = comps or {}
+    feats = [_num(cv.get(c), 0.0) for c in CAPS] + [_num(comps.get(k), 0.0) for k in RISK_KEYS]
+    return feats, [_num(save_score, np.nan), _num(risk_V, np.nan)]
+
+
+def feature_row(results: Dict[str, Any]) -> Tuple[List[float], List[float]]:
+    """(features, [save_score, V]) from stored `results`; missing features are 0 as in the engine."""
+    results = results or {}
+    risk = results.get("risk") or {}
+    return _row(results.get("capital_vector"), risk.get("components"), results.get("save_score"), risk.get("V"))
+
+
+class SimilarityIndex:
+    def __init__(self, dim: int = len(FEATURES)):
+        self.dim = dim
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()  # one refresh at a time; guards the watermarks
+        self._refresher: Optional[threading.Thread] = None
+        self._X = np.zeros((0, dim), dtype=np.float32)
+        self._norms = np.zeros(0, dtype=np.float32)
+        self._aux = np.zeros((0, len(_AUX)), dtype=np.float32)
+        self._profile = np.zeros(0, dtype=np.int64)
+        self._alive = np.zeros(0, dtype=bool)
+        self._n = 0
+        self._dead = 0
+        self._row: Dict[str, int] = {}
+        self._profile_codes: Dict[str, int] = {}
+        self._upsert_after: Optional[Tuple[datetime, str]] = None
+        self._delete_after: Optional[Tuple[datetime, str]] = None
+        self.loaded = False
+        self.refreshed_at = 0.0
+        self.last_error: Optional[str] = None
+
+    def __len__(self) -> int:
+        return self._n - self._dead
+
+    # -- maintenance (callers hold self._lock) ---------------------------------
+
+    def _grow(self, need: int) -> None:
+        cap = self._X.shape[0]
+        if need <= cap:
+            return
+        new_cap = max(need, cap * 2, 1024)
+        for name in ("_X", "_norms", "_aux", "_profile", "_alive"):
+            old = getattr(self, name)
+            new = np.zeros((new_cap,) + old.shape[1:], dtype=old.dtype)
+            new[: self._n] = old[: self._n]
+            setattr(self, name, new)
+
+    def _upsert(self, assessment_id: str, profile_id: str, feats: List[float], aux: List[float]) -> None:
+        i = self._row.get(assessment_id)
+        if i is None:
+            self._grow(self._n + 1)
+            i = self._n
+            self._n += 1
+            self._row[assessment_id] = i
+            self._alive[i] = True
+        self._X[i] = feats
+        self._norms[i] = float(np.dot(self._X[i], self._X[i]))
+        self._aux[i] = aux
+        self._profile[i] = self._profile_codes.setdefault(profile_id, len(self._profile_codes))
+
+    def _remove(self, assessment_id: str) -> None:
+        i = self._row.pop(assessment_id, None)
+        if i is not None and self._alive[i]:
+            self._alive[i] = False
+            self._dead += 1
+
+    def _compact(self) -> None:
+        keep = np.flatnonzero(self._alive[: self._n])
+        ids = sorted(self._row, key=self._row.get)
+        for name in ("_X", "_norms", "_aux", "_profile", "_alive"):
+            setattr(self, name, np.ascontiguousarray(getattr(self, name)[keep]))
+        self._row = {aid: j for j, aid in enumerate(ids)}
+        self._n = len(keep)
+        self._dead = 0
+
+    # -- public API ------------------------------------------------------------
+
+    def add(self, assessment_id: str, profile_id: str, results: Dict[str, Any]) -> None:
+        """Apply a fresh insert immediately (the change feed will see it again later)."""
+        if not self.loaded:
+            return
+        feats, aux = feature_row(results)
+        with self._lock:
+            self._upsert(assessment_id, profile_id, feats, aux)
+
+    def refresh(self, db: Session) -> int:
+        """Pull changes since the last watermark. Returns the number of rows applied.
+
+        Chunks are fetched without holding the index lock and applied under it.
+        """
+        applied = 0
+        with self._refresh_lock:
+            while True:
+                rows = list_changed_vectors(db, self._upsert_after, CHANGEFEED_SETTLE_SECONDS, limit=_LOAD_CHUNK)
+                parsed = [(r.assessment_id, r.profile_id, *_row(r.capital_vector, r.risk_components, r.save_score, r.risk_V)) for r in rows]
+                with self._lock:
+                    for args in parsed:
+                        self._upsert(*args)
+                if rows:
+                    self._upsert_after = (rows[-1].updated_at, rows[-1].assessment_id)
+                applied += len(rows)
+                if len(rows) < _LOAD_CHUNK:
+                    break
+            while True:
+                tombs = list_tombstones(db, self._delete_after, CHANGEFEED_SETTLE_SECONDS, limit=_LOAD_CHUNK)
+                with self._lock:
+                    for t in tombs:
+                        self._remove(t.assessment_id)
+                if tombs:
+                    self._delete_after = (tombs[-1].deleted_at, tombs[-1].assessment_id)
+                applied += len(tombs)
+                db.expunge_all()
+                if len(tombs) < _LOAD_CHUNK:
+                    break
+            with self._lock:
+                if self._dead > max(1024, self._n // 4):
+                    self._compact()
+                self.loaded = True
+                self.refreshed_at = time.monotonic()
+        return applied
+
+    def start_refresher(self, session_factory: Callable[[], Session], interval: float) -> bool:
+        """Start the background thread that loads the index and then follows the
+        change feed every `interval` seconds. Returns True if it was started now."""
+        with self._lock:
+            if self._refresher is not None:
+                return False
+            self._refresher = threading.Thread(
+                target=self._refresh_loop, args=(session_factory, interval), name="similarity-refresh", daemon=True,
+            )
+        self._refresher.start()
+        return True
+
+    def _refresh_loop(self, session_factory: Callable[[], Session], interval: float) -> None:
+        while True:
+            try:
+                with session_factory() as db:
+                    self.refresh(db)
+                self.last_error = None
+            except Exception as e:  # keep serving the current state; retry next round
+                self.last_error = f"{type(e).__name__}: {e}"
+            time.sleep(interval)
+
+    def vector_for(self, assessment_id: str) -> Optional[Tuple[np.ndarray, int]]:
+        with self._lock:
+            i = self._row.get(assessment_id)
+            if i is None:
+                return None
+            return self._X[i].copy(), int(self._profile[i])
+
+    def profile_code(self, profile_id: str) -> int:
+        return self._profile_codes.get(profile_id, -1)
+
+    def query(self, q: np.ndarray, k: int, exclude_profile: int = -1) -> Tuple[np.ndarray, np.ndarray]:
+        """(features, aux) of the k nearest live rows (excluding one profile), nearest first.
+
+        Both are gathered from the same array snapshot, so a concurrent
+        refresh/compaction can't shift the rows between search and gather.
+        """
+        with self._lock:
+            n = self._n
+            X, norms, alive, prof, aux = self._X, self._norms, self._alive, self._profile, self._aux
+        q = np.asarray(q, dtype=np.float32)
+        qq = float(np.dot(q, q))
+        best_d = np.zeros(0, dtype=np.float32)
+        best_i = np.zeros(0, dtype=np.int64)
+        for start in range(0, n, _QUERY_CHUNK):
+            stop = min(n, start + _QUERY_CHUNK)
+            d = norms[start:stop] - 2.0 * (X[start:stop] @ q) + qq
+            d[~alive[start:stop] | (prof[start:stop] == exclude_profile)] = np.inf
+            if d.shape[0] > k:
+                part = np.argpartition(d, k)[:k]
+            else:
+                part = np.arange(d.shape[0])
+            best_d = np.concatenate([best_d, d[part]])
+            best_i = np.concatenate([best_i, part + start])
+            if best_d.shape[0] > k:
+                keep = np.argpartition(best_d, k)[:k]
+                best_d, best_i = best_d[keep], best_i[keep]
+        finite = np.isfinite(best_d)
+        best_d, best_i = best_d[finite], best_i[finite]
+        order = np.argsort(best_d, kind="stable")
+        rows = best_i[order]
+        return X[rows], aux[rows]
+
+    @staticmethod
+    def aggregate(X: np.ndarray, aux: np.ndarray, q: np.ndarray) -> Dict[str, Any]:
+        """Aggregate view of a neighbour set: means/std of features, mean score/V, distances."""
+        dist = np.sqrt(np.maximum(((X - np.asarray(q, dtype=np.float32)) ** 2).sum(axis=1), 0.0))
+        mean = X.mean(axis=0)
+        std = X.std(axis=0)
+        nc = len(CAPS)
+
+        def r6(x):
+            return round(float(x), 6)
+
+        def nanmean(col):
+            vals = aux[:, col]
+            vals = vals[~np.isnan(vals)]
+            return r6(vals.mean()) if vals.size else None
+
+        return {
+            "count": int(X.shape[0]),
+            "distance": {"mean": r6(dist.mean()), "max": r6(dist.max())},
+            "capital_vector": {
+                "mean": {c: r6(mean[i]) for i, c in enumerate(CAPS)},
+                "std": {c: r6(std[i]) for i, c in enumerate(CAPS)},
+            },
+            "risk_components": {"mean": {k: r6(mean[nc + i]) for i, k in enumerate(RISK_KEYS)}},
+            "mean_risk_V": nanmean(_AUX.index("risk_V")),
+            "mean_save_score": nanmean(_AUX.index("save_score")),
+        }
+
+
+SIMILARITY_INDEX = SimilarityIndex()
@@ -0,0 +1,211 @@
+"""Monte Carlo uncertainty for partially answered questionnaires.
+
+Unanswered questionnaire items are imputed by sampling from cohort answer
+distributions (per sector when the cohort is large enough, else global;
+uniform if no data is available), and all samples are scored at once with
+`save_engine.diagnose_batch`. The result is a set of percentile intervals
+for save_score, the capitals and V, plus how stable the point-estimate
+bottleneck ranking is across samples.
+"""
+
+from __future__ import annotations
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+import numpy as np
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from .config import (
+    CAPS, UNCERTAINTY_COHORT_ROWS, UNCERTAINTY_COHORT_MIN, UNCERTAINTY_COHORT_TTL_SECONDS,
+)
+from .models_db import SaveAssessment
+from .responses_codec import current_schema_version, layout_for, decode_responses_norm
+from .save_engine import diagnose_batch
+
+# Answers are on a 0..5 scale, normalized to 0..1 (reverse items stay on the grid).
+LEVELS = np.linspace(0.0, 1.0, 6)
+PERCENTILES = [5, 50, 95]
+
+
+class CohortPriors:
+    """Per-item answer distributions over LEVELS, globally and per sector."""
+
+    def __init__(self, keys: List[str], counts: Dict[str, np.ndarray], sizes: Dict[str, int], source: str):
+        self.keys = keys
+        self.counts = counts  # cohort -> (len(keys), len(LEVELS)) answer counts
+        self.sizes = sizes    # cohort -> number of assessments
+        self.source = source
+
+    @classmethod
+    def uniform(cls, keys: List[str]) -> "CohortPriors":
+        return cls(keys, {"*": np.zeros((len(keys), len(LEVELS)))}, {"*": 0}, "uniform")
+
+    @classmethod
+    def load(cls, db: Session, keys: List[str], limit: int = UNCERTAINTY_COHORT_ROWS) -> "CohortPriors":
+        col = {k: i for i, k in enumerate(keys)}
+        A = SaveAssessment
+        rows = (
+            db.query(A.meta_public["sector"].astext.label("sector"), A.responses_norm, A.schema_version, A.responses_vec)
+            .filter(A.consent_research == True)
+            .filter((A.responses_vec.isnot(None)) | (A.responses_norm != {}))
+            .order_by(A.created_at.desc())
+            .limit(limit)
+            .all()
+        )
+        counts: Dict[str, np.ndarray] = {"*": np.zeros((len(keys), len(LEVELS)))}
+        sizes: Dict[str, int] = {"*": 0}
+        for r in rows:
+            targets = [counts["*"]]
+            sizes["*"] += 1
+            cohort = _cohort_key(r.sector)
+            if cohort != "*":
+                if cohort not in counts:
+                    counts[cohort] = np.zeros((len(keys), len(LEVELS)))
+                    sizes[cohort] = 0
+                sizes[cohort] += 1
+                targets.append(counts[cohort])
+            for k, v in decode_responses_norm(r).items():
+                i = col.get(k)
+                if i is None or not isinstance(v, (int, float)):
+                    continue
+                lvl = int(min(5, max(0, round(float(v) * 5))))
+                for t in targets:
+                    t[i, lvl] += 1
+        return cls(keys, counts, sizes, "cohort" if rows else "uniform")
+
+    def probabilities(self, meta: Dict[str, Any]) -> tuple[np.ndarray, str]:
+        """(len(keys), len(LEVELS)) probabilities, Laplace-smoothed, and the cohort used."""
+        cohort = _cohort_of(meta)
+        if self.sizes.get(cohort, 0) < UNCERTAINTY_COHORT_MIN:
+            cohort = "*"
+        c = self.counts[cohort] + 1.0
+        return c / c.sum(axis=1, keepdims=True), cohort
+
+
+def _cohort_key(sector: Any) -> str:
+    return str(sector if sector is not None else "").strip().upper() or "*"
+
+
+def _cohort_of(meta: Dict[str, Any]) -> str:
+    return _cohort_key(meta.get("sector"))
+
+
+_priors_lock = threading.Lock()
+_priors_cache: Dict[str, Any] = {"priors": None, "loaded_at": 0.0, "refreshing": False}
+
+
+def _load_priors(session_factory: Callable[[], Session], keys: List[str]) -> Optional[CohortPriors]:
+    try:
+        with session_factory() as db:
+            return CohortPriors.load(db, keys)
+    except SQLAlchemyError:
+        return None
+
+
+def _refresh_priors(session_factory: Callable[[], Session], keys: List[str]) -> None:
+    priors = _load_priors(session_factory, keys)
+    with _priors_lock:
+        if priors is not None:  # on DB errors keep serving the previous priors
+            _priors_cache["priors"] = priors
+        _priors_cache.update(loaded_at=time.monotonic(), refreshing=False)
+
+
+def get_cohort_priors(session_factory: Optional[Callable[[], Session]]) -> CohortPriors:
+    """Cached priors, refreshed every UNCERTAINTY_COHORT_TTL_SECONDS.
+
+    Only the first call loads inline; afterwards expired priors keep being
+    served while a single background thread reloads them. Uniform without a
+    database (`session_factory` None) or when the first load fails.
+    """
+    keys = list(layout_for(current_schema_version()))
+    if session_factory is None:
+        return CohortPriors.uniform(keys)
+    with _priors_lock:
+        cached = _priors_cache["priors"]
+        if cached is not None:
+            if time.monotonic() - _priors_cache["loaded_at"] >= UNCERTAINTY_COHORT_TTL_SECONDS and not _priors_cache["refreshing"]:
+                _priors_cache["refreshing"] = True
+                threading.Thread(
+                    target=_refresh_priors, args=(session_factory, keys), name="cohort-priors", daemon=True,
+                ).start()
+            return cached
+        # First load: concurrent callers wait on the lock and share the result.
+        priors = _load_priors(session_factory, keys) or CohortPriors.uniform(keys)
+        _priors_cache.update(priors=priors, loaded_at=time.monotonic())
+        return priors
+
+
+def _interval(x: np.ndarray) -> Dict[str, float]:
+    p = np.percentile(x, PERCENTILES)
+    return {
+        "mean": round(float(x.mean()), 6),
+        "std": round(float(x.std()), 6),
+        "p05": round(float(p[0]), 6),
+        "p50": round(float(p[1]), 6),
+        "p95": round(float(p[2]), 6),
+    }
+
+
+def diagnose_uncertainty(
+    meta: Dict[str, Any],
+    normed: Dict[str, float],
+    bottlenecks: List[dict],
+    priors: CohortPriors,
+    samples: int = 2000,
+    seed: Optional[int] = None,
+) -> dict:
+    """Impute unanswered layout items `samples` times and summarize the spread.
+
+    `bottlenecks` is the point-estimate ranking from `diagnose`; its stability
+    is reported as the share of samples where each pair stays in the top 5 /
+    keeps its rank.
+    """
+    layout = priors.keys
+    in_layout = set(layout)
+    keys = list(layout) + [k for k in normed if k not in in_layout]
+    missing = [i for i, k in enumerate(layout) if k not in normed]
+    n = samples if missing else 1
+
+    base = np.array([normed.get(k, np.nan) for k in keys], dtype=float)
+    X = np.repeat(base[None, :], n, axis=0)
+    probs, cohort = priors.probabilities(meta)
+    if missing:
+        rng = np.random.default_rng(seed)
+        cdf = np.cumsum(probs[missing], axis=1)
+        u = rng.random((n, len(missing)))
+        lvl = (u[:, :, None] > cdf[None, :, :-1]).sum(axis=2)
+        X[:, missing] = LEVELS[lvl]
+
+    out = diagnose_batch(meta, keys, X)
+
+    # Sample bottleneck ranking: same ordering rules as `diagnose` (stable, desc priority).
+    T = out["T"].reshape(n, 25)
+    pri = out["priority"].reshape(n, 25)
+    valid = (T > 0) & ~np.eye(5, dtype=bool).reshape(1, 25)
+    pri = np.where(valid, pri, -np.inf)
+    order = np.argsort(-pri, axis=1, kind="stable")[:, :5]
+    top_valid = np.take_along_axis(valid, order, axis=1)
+    order = np.where(top_valid, order, -1)
+
+    stability = []
+    for rank, b in enumerate(bottlenecks[:5]):
+        cell = CAPS.index(b["from"]) * 5 + CAPS.index(b["to"])
+        stability.append({
+            "from": b["from"],
+            "to": b["to"],
+            "rank": rank + 1,
+            "p_same_rank": round(float((order[:, rank] == cell).mean()), 4),
+            "p_in_top5": round(float((order == cell).any(axis=1).mean()), 4),
+        })
+
+    return {
+        "samples": int(n),
+        "interval": "p05-p95",
+        "missing_items": [layout[i] for i in missing],
+        "imputation": {"source": priors.source, "cohort": cohort},
+        "save_score": _interval(out["save_score"]),
+        "capital_vector": {c: _interval(out["capital_vector"][:, i]) for i, c in enumerate(CAPS)},
+        "risk_V": _interval(out["V"]),
+        "bottleneck_stability": stability,
+    }
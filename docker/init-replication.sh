@@ -0,0 +1,4 @@
+#!/bin/bash
+# Primary init (docker-entrypoint-initdb.d): allow streaming replication for the local replica.
+set -e
+echo "host replication all all scram-sha-256" >> "$PGDATA/pg_hba.conf"
@@ -0,0 +1,158 @@
+"""Compare JSONB vs packed float32 storage for `responses_norm`.
+
+Offline (always): synthesizes BENCH_ROWS fully answered questionnaires and
+reports payload bytes per row plus encode/decode throughput for both formats
+(JSONB decode is approximated by `json.loads`, which is what psycopg2 does).
+
+Online (when DATABASE_URL is set): copies up to BENCH_ROWS rows (decoded to
+full answers; synthetic rows if the table is empty) into two temp tables, one
+with JSONB-only and one with packed responses, and reports for each the
+average `pg_column_size` per row and of the responses columns, the total
+relation size, and rows/s of the export query and of a full-row read that
+also decodes the answers.
+"""
+
+from __future__ import annotations
+import json
+import os
+import sys
+import time
+from pathlib import Path
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from app.responses_codec import current_schema_version, layout_for, encode, decode  # noqa: E402
+from app.save_engine import normalize_responses  # noqa: E402
+
+BENCH_ROWS = int(os.getenv("BENCH_ROWS", "20000"))
+
+def _timed(fn, n):
+    t0 = time.perf_counter()
+    fn()
+    dt = time.perf_counter() - t0
+    return dt, n / dt if dt > 0 else float("inf")
+
+def offline():
+    version = current_schema_version()
+    keys = layout_for(version)
+    rng = np.random.default_rng(0)
+    answers = rng.integers(0, 6, size=(BENCH_ROWS, len(keys)))
+    normed = [
+        {k: round(v, 6) for k, v in normalize_responses(dict(zip(keys, row.tolist()))).items()}
+        for row in answers
+    ]
+
+    as_json = [json.dumps(r) for r in normed]
+    packed = [encode(r, version) for r in normed]
+
+    json_bytes = sum(len(s.encode("utf-8")) for s in as_json) / BENCH_ROWS
+    vec_bytes = sum(len(v) + len(json.dumps(x)) for v, x in packed) / BENCH_ROWS
+
+    _, json_enc = _timed(lambda: [json.dumps(r) for r in normed], BENCH_ROWS)
+    _, vec_enc = _timed(lambda: [encode(r, version) for r in normed], BENCH_ROWS)
+    _, json_dec = _timed(lambda: [json.loads(s) for s in as_json], BENCH_ROWS)
+    _, vec_dec = _timed(lambda: [decode(v, version, x) for v, x in packed], BENCH_ROWS)
+
+    assert all(decode(v, version, x) == r for (v, x), r in zip(packed[:100], normed[:100]))
+
+    print(f"rows={BENCH_ROWS} layout={len(keys)} slots schema_version={version}")
+    print(f"payload bytes/row   jsonb(text)={json_bytes:8.1f}  packed={vec_bytes:8.1f}  ({json_bytes / vec_bytes:.1f}x smaller)")
+    print(f"encode rows/s       jsonb={json_enc:10.0f}  packed={vec_enc:10.0f}")
+    print(f"decode rows/s       jsonb={json_dec:10.0f}  packed={vec_dec:10.0f}")
+
+_SAMPLE_COLS = "assessment_id, profile_id, created_at, consent_research, meta_public, results"
+# Same columns/filter/order as crud.list_assessments_for_export (responses deferred).
+_EXPORT_SQL = "SELECT " + _SAMPLE_COLS + " FROM {t} WHERE consent_research ORDER BY created_at LIMIT :n"
+_FULL_SQL = "SELECT * FROM {t} ORDER BY created_at LIMIT :n"
+
+def _sample_rows(conn, version):
+    """Up to BENCH_ROWS rows as (columns, full responses_norm), decoded from
+    whichever format they are stored in; synthetic rows if the table is empty."""
+    from sqlalchemy import text
+    from app.responses_codec import decode_responses_norm
+
+    rows = conn.execute(text(
+        f"SELECT {_SAMPLE_COLS}, responses_norm, schema_version, responses_vec "
+        "FROM save_assessments ORDER BY created_at DESC LIMIT :n"
+    ), {"n": BENCH_ROWS}).all()
+    if rows:
+        return [(dict(r._mapping), decode_responses_norm(r)) for r in rows], "save_assessments sample"
+
+    from datetime import datetime, timedelta, timezone
+    import uuid
+    keys = layout_for(version)
+    rng = np.random.default_rng(1)
+    t0 = datetime.now(timezone.utc)
+    out = []
+    for i, row in enumerate(rng.integers(0, 6, size=(BENCH_ROWS, len(keys)))):
+        normed = {k: round(v, 6) for k, v in normalize_responses(dict(zip(keys, row.tolist()))).items()}
+        cols = {
+            "assessment_id": str(uuid.uuid4()), "profile_id": str(uuid.uuid4()),
+            "created_at": t0 - timedelta(seconds=i), "consent_research": True,
+            "meta_public": {"sector": "CCS"}, "results": {"save_score": 0.5},
+        }
+        out.append((cols, normed))
+    return out, "synthetic"
+
+def online(database_url: str):
+    """Before/after on identical rows: the sample is copied into a jsonb-only and
+    a packed temp table, then row size and export throughput are measured on each."""
+    from sqlalchemy import create_engine, text, bindparam, LargeBinary
+    from sqlalchemy.dialects.postgresql import JSONB
+    from app.responses_codec import decode_responses_norm
+
+    version = current_schema_version()
+    engine = create_engine(database_url, future=True)
+    with engine.connect() as conn:
+        sample, source = _sample_rows(conn, version)
+        tables = {}
+        for name, packed in (("jsonb", False), ("packed", True)):
+            t = f"bench_responses_{name}"
+            conn.execute(text(f"CREATE TEMP TABLE {t} (LIKE save_assessments INCLUDING DEFAULTS)"))
+            params = []
+            for cols, normed in sample:
+                vec, extras = encode(normed, version) if packed else (None, normed)
+                params.append({**cols, "responses_norm": extras, "schema_version": version if packed else None, "responses_vec": vec})
+            conn.execute(text(
+                f"INSERT INTO {t} ({_SAMPLE_COLS}, responses_norm, schema_version, responses_vec) "
+                "VALUES (:assessment_id, :profile_id, :created_at, :consent_research, :meta_public, :results, "
+                ":responses_norm, :schema_version, :responses_vec)"
+            ).bindparams(
+                bindparam("meta_public", type_=JSONB), bindparam("results", type_=JSONB),
+                bindparam("responses_norm", type_=JSONB), bindparam("responses_vec", type_=LargeBinary),
+            ), params)
+            conn.execute(text(f"ANALYZE {t}"))
+            tables[name] = t
+        conn.commit()
+
+        print(f"online: {len(sample)} rows ({source}) copied into jsonb-only and packed temp tables")
+        for name, t in tables.items():
+            size = conn.execute(text(f"""
+                SELECT avg(pg_column_size(t.*)),
+                       avg(coalesce(pg_column_size(responses_norm), 0) + coalesce(pg_column_size(responses_vec), 0)),
+                       pg_total_relation_size('{t}')
+                FROM {t} t
+            """)).one()
+            timings = {}
+            for label, sql in (("export", _EXPORT_SQL), ("full-row", _FULL_SQL)):
+                best = float("inf")
+                for _ in range(3):
+                    t0 = time.perf_counter()
+                    rows = conn.execute(text(sql.format(t=t)), {"n": len(sample)}).all()
+                    if label == "full-row":
+                        for r in rows:
+                            decode_responses_norm(r)
+                    n = len(rows)
+                    best = min(best, time.perf_counter() - t0)
+                timings[label] = n / best if best > 0 else float("inf")
+            print(
+                f"{name:7s} row bytes={float(size[0]):8.1f}  responses bytes={float(size[1]):8.1f}  "
+                f"table+toast={int(size[2]) / 1024:8.0f} KiB  export {timings['export']:10.0f} rows/s  "
+                f"full-row+decode {timings['full-row']:10.0f} rows/s"
+            )
+
+if __name__ == "__main__":
+    offline()
+    url = os.getenv("DATABASE_URL", "").strip()
+    if url:
+        online(url)
@@ -1,8 +1,10 @@
 """SAVE data retention cleanup.
 
 Default policy:
-- After 90 days: clear `responses_norm` (set to empty JSON) while keeping `results` + `meta_public` for aggregated research.
+- After 90 days: clear `responses_norm` (set to empty JSON) and the packed `responses_vec` while keeping `results` + `meta_public` for aggregated research.
 - Optional: hard-delete records older than RETENTION_DELETE_DAYS (disabled by default).
+  Deleted consented records leave a tombstone for the incremental export
+  (`/v1/save/research/changes`); tombstones are purged after TOMBSTONE_RETENTION_DAYS.
 """
 
 from __future__ import annotations
@@ -16,6 +18,7 @@ if not DATABASE_URL:
 
 ANONYMIZE_AFTER_DAYS = int(os.getenv("ANONYMIZE_AFTER_DAYS", "90"))
 RETENTION_DELETE_DAYS = int(os.getenv("RETENTION_DELETE_DAYS", "0"))  # 0 = disabled
+TOMBSTONE_RETENTION_DAYS = int(os.getenv("TOMBSTONE_RETENTION_DAYS", "35"))  # 0 = keep forever
 
 engine = create_engine(DATABASE_URL, pool_pre_ping=True, future=True)
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False, future=True)
@@ -24,26 +27,46 @@ def main():
     with SessionLocal() as db:
         q1 = text("""
             UPDATE save_assessments
-            SET responses_norm = '{}'::jsonb
+            SET responses_norm = '{}'::jsonb,
+                responses_vec = NULL,
+                updated_at = NOW()
             WHERE created_at < (NOW() - (:days || ' days')::interval)
-              AND responses_norm IS NOT NULL
-              AND responses_norm <> '{}'::jsonb;
+              AND (responses_vec IS NOT NULL
+                   OR (responses_norm IS NOT NULL AND responses_norm <> '{}'::jsonb));
         """)
         r1 = db.execute(q1, {"days": ANONYMIZE_AFTER_DAYS}).rowcount
 
         r2 = 0
         if RETENTION_DELETE_DAYS and RETENTION_DELETE_DAYS > 0:
             q2 = text("""
-                DELETE FROM save_assessments
-                WHERE created_at < (NOW() - (:days || ' days')::interval);
+                WITH gone AS (
+                    DELETE FROM save_assessments
+                    WHERE created_at < (NOW() - (:days || ' days')::interval)
+                    RETURNING assessment_id, consent_research
+                ), tombs AS (
+                    INSERT INTO save_assessment_tombstones (assessment_id, deleted_at)
+                    SELECT assessment_id, NOW() FROM gone WHERE consent_research
+                    ON CONFLICT (assessment_id) DO NOTHING
+                )
+                SELECT count(*) FROM gone;
             """)
-            r2 = db.execute(q2, {"days": RETENTION_DELETE_DAYS}).rowcount
+            r2 = db.execute(q2, {"days": RETENTION_DELETE_DAYS}).scalar()
+
+        r3 = 0
+        if TOMBSTONE_RETENTION_DAYS and TOMBSTONE_RETENTION_DAYS > 0:
+            q3 = text("""
+                DELETE FROM save_assessment_tombstones
+                WHERE deleted_at < (NOW() - (:days || ' days')::interval);
+            """)
+            r3 = db.execute(q3, {"days": TOMBSTONE_RETENTION_DAYS}).rowcount
 
         db.commit()
 
     print(f"Anonymized responses_norm for {r1} records (>= {ANONYMIZE_AFTER_DAYS} days old).") 
     if RETENTION_DELETE_DAYS and RETENTION_DELETE_DAYS > 0:
         print(f"Deleted {r2} records (>= {RETENTION_DELETE_DAYS} days old).") 
+    if r3:
+        print(f"Purged {r3} tombstones (>= {TOMBSTONE_RETENTION_DAYS} days old).")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,256 @@
+"""Data-driven archetype discovery (offline).
+
+Streams consented capital vectors + risk components from the database in
+chunks, clusters them with mini-batch k-means, and reports per cluster:
+size, centroid, spread, and overlap with the hand-written archetypes in
+app/profile_archetypes.json (including how many rows match none of them and
+fall back to "SAVE Profile (generic)"). Optionally writes candidate rules in
+the archetype JSON format for review; their labels are auto-generated
+placeholders and `signals` are left empty for a human to fill in.
+
+Settings (env):
+- DISCOVER_K=12              clusters
+- DISCOVER_ITERS=300         mini-batch iterations
+- DISCOVER_BATCH=4096        mini-batch size
+- DISCOVER_CHUNK=50000       rows per DB fetch / assignment chunk
+- DISCOVER_LIMIT=0           max rows to load (0 = all)
+- DISCOVER_WORKERS=<cpus>    threads for the full assignment pass
+- DISCOVER_SEED=0
+- DISCOVER_REPORT=path.json  write the full report
+- DISCOVER_CANDIDATES=path.json  write candidate archetype rules
+
+Usage:
+    python scripts/discover_archetypes.py
+"""
+
+from __future__ import annotations
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Tuple
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from app.config import CAPS  # noqa: E402
+from app.profile_engine import load_archetypes  # noqa: E402
+from app.similarity import FEATURES  # noqa: E402
+from app.save_engine import RISK_KEYS  # noqa: E402
+
+DISCOVER_K = int(os.getenv("DISCOVER_K", "12"))
+DISCOVER_ITERS = int(os.getenv("DISCOVER_ITERS", "300"))
+DISCOVER_BATCH = int(os.getenv("DISCOVER_BATCH", "4096"))
+DISCOVER_CHUNK = int(os.getenv("DISCOVER_CHUNK", "50000"))
+DISCOVER_LIMIT = int(os.getenv("DISCOVER_LIMIT", "0"))
+DISCOVER_WORKERS = int(os.getenv("DISCOVER_WORKERS", str(os.cpu_count() or 1)))
+DISCOVER_SEED = int(os.getenv("DISCOVER_SEED", "0"))
+DISCOVER_REPORT = os.getenv("DISCOVER_REPORT", "").strip()
+DISCOVER_CANDIDATES = os.getenv("DISCOVER_CANDIDATES", "").strip()
+
+def load_vectors(database_url: str) -> np.ndarray:
+    """Server-side cursor over consented rows -> (n, len(FEATURES)) float32."""
+    from sqlalchemy import create_engine, text
+
+    engine = create_engine(database_url, future=True)
+    q = text(f"""
+        SELECT results->'capital_vector', results->'risk'->'components'
+        FROM save_assessments
+        WHERE consent_research = true
+        {"LIMIT :limit" if DISCOVER_LIMIT > 0 else ""}
+    """)
+    chunks: List[np.ndarray] = []
+    with engine.connect().execution_options(stream_results=True, yield_per=DISCOVER_CHUNK) as conn:
+        result = conn.execute(q, {"limit": DISCOVER_LIMIT} if DISCOVER_LIMIT > 0 else {})
+        for part in result.partitions():
+            buf = np.zeros((len(part), len(FEATURES)), dtype=np.float32)
+            for i, (cv, comps) in enumerate(part):
+                cv = cv or {}
+                comps = comps or {}
+                buf[i, : len(CAPS)] = [float(cv.get(c) or 0.0) for c in CAPS]
+                buf[i, len(CAPS):] = [float(comps.get(k) or 0.0) for k in RISK_KEYS]
+            chunks.append(buf)
+            print(f"Loaded {sum(len(c) for c in chunks)} rows...", flush=True)
+    return np.concatenate(chunks) if chunks else np.zeros((0, len(FEATURES)), dtype=np.float32)
+
+def _onehot(labels: np.ndarray, k: int) -> np.ndarray:
+    M = np.zeros((labels.shape[0], k), dtype=np.float32)
+    M[np.arange(labels.shape[0]), labels] = 1.0
+    return M
+
+def _sq_dists(X: np.ndarray, C: np.ndarray) -> np.ndarray:
+    return (X * X).sum(axis=1)[:, None] - 2.0 * (X @ C.T) + (C * C).sum(axis=1)[None, :]
+
+def kmeans_pp_init(X: np.ndarray, k: int, rng: np.random.Generator, sample: int = 100000) -> np.ndarray:
+    S = X[rng.choice(X.shape[0], size=min(sample, X.shape[0]), replace=False)]
+    C = [S[rng.integers(S.shape[0])]]
+    d = ((S - C[0]) ** 2).sum(axis=1)
+    for _ in range(1, k):
+        p = d / d.sum() if d.sum() > 0 else None
+        C.append(S[rng.choice(S.shape[0], p=p)])
+        d = np.minimum(d, ((S - C[-1]) ** 2).sum(axis=1))
+    return np.array(C, dtype=np.float32)
+
+def minibatch_kmeans(X: np.ndarray, k: int, iters: int, batch: int, seed: int = 0) -> np.ndarray:
+    """Sculley-style mini-batch k-means with per-centre learning rates 1/count."""
+    rng = np.random.default_rng(seed)
+    C = kmeans_pp_init(X, k, rng)
+    counts = np.zeros(k, dtype=np.float64)
+    for _ in range(iters):
+        B = X[rng.integers(0, X.shape[0], size=batch)]
+        labels = _sq_dists(B, C).argmin(axis=1)
+        n_j = np.bincount(labels, minlength=k).astype(np.float64)
+        sums = (_onehot(labels, k).T @ B).astype(np.float64)
+        counts += n_j
+        hit = n_j > 0
+        C[hit] += ((sums[hit] - n_j[hit, None] * C[hit]) / counts[hit, None]).astype(np.float32)
+    return C
+
+def archetype_bounds(archetypes: List[dict]) -> Tuple[np.ndarray, np.ndarray]:
+    """(lo, hi) arrays of shape (A, dims) so `match_archetypes` becomes lo <= x <= hi."""
+    col = {f: i for i, f in enumerate(FEATURES)}
+    lo = np.full((len(archetypes), len(FEATURES)), -np.inf, dtype=np.float32)
+    hi = np.full((len(archetypes), len(FEATURES)), np.inf, dtype=np.float32)
+    for a, arc in enumerate(archetypes):
+        when = arc.get("when", {})
+        for rules in (when.get("capital_vector", {}), when.get("risk_components", {})):
+            for key, rule in rules.items():
+                if key not in col:
+                    # Unknown key: the engine reads 0.0 for it; fold that in now.
+                    ok = (("gte" not in rule or 0.0 >= float(rule["gte"]))
+                          and ("lte" not in rule or 0.0 <= float(rule["lte"])))
+                    if not ok:
+                        lo[a, :] = np.inf
+                    continue
+                if "gte" in rule:
+                    lo[a, col[key]] = max(lo[a, col[key]], float(rule["gte"]))
+                if "lte" in rule:
+                    hi[a, col[key]] = min(hi[a, col[key]], float(rule["lte"]))
+    return lo, hi
+
+def assign_and_summarize(X: np.ndarray, C: np.ndarray, lo: np.ndarray, hi: np.ndarray) -> Dict[str, np.ndarray]:
+    """Full pass (threaded over chunks): sizes, sums, sums of squares, inertia,
+    and per-cluster archetype match counts (column A = matched none)."""
+    k, dims, A = C.shape[0], C.shape[1], lo.shape[0]
+
+    def work(start: int):
+        Xc = X[start : start + DISCOVER_CHUNK]
+        d = _sq_dists(Xc, C)
+        labels = d.argmin(axis=1)
+        match = ((Xc[:, None, :] >= lo[None]) & (Xc[:, None, :] <= hi[None])).all(axis=2)
+        match = np.concatenate([match, ~match.any(axis=1, keepdims=True)], axis=1)
+        M = _onehot(labels, k).T.astype(np.float64)
+        Xd = Xc.astype(np.float64)
+        return (np.bincount(labels, minlength=k), M @ Xd, M @ (Xd * Xd), M @ match,
+                float(np.maximum(d[np.arange(len(labels)), labels], 0).sum()))
+
+    out = {"size": np.zeros(k), "sum": np.zeros((k, dims)), "sumsq": np.zeros((k, dims)),
+           "arc": np.zeros((k, A + 1)), "inertia": 0.0}
+    with ThreadPoolExecutor(max_workers=max(1, DISCOVER_WORKERS)) as ex:
+        for size, sums, sq, arc, inertia in ex.map(work, range(0, X.shape[0], DISCOVER_CHUNK)):
+            out["size"] += size; out["sum"] += sums; out["sumsq"] += sq
+            out["arc"] += arc; out["inertia"] += inertia
+    return out
+
+def candidate_rules(stats: Dict[str, np.ndarray], X: np.ndarray, z: float = 0.5) -> List[dict]:
+    """One rule per cluster: bound each feature whose cluster mean sits more than
+    `z` global std away from the global mean, at cluster mean -/+ 1 cluster std."""
+    size = np.maximum(stats["size"], 1)[:, None]
+    mean = stats["sum"] / size
+    std = np.sqrt(np.maximum(stats["sumsq"] / size - mean ** 2, 0.0))
+    g_mean, g_std = X.mean(axis=0), X.std(axis=0) + 1e-9
+    out = []
+    for j in np.argsort(-stats["size"]):
+        if stats["size"][j] == 0:
+            continue
+        when = {"capital_vector": {}, "risk_components": {}}
+        tags = []
+        for f, name in enumerate(FEATURES):
+            dev = (mean[j, f] - g_mean[f]) / g_std[f]
+            if abs(dev) < z:
+                continue
+            group = "capital_vector" if name in CAPS else "risk_components"
+            if dev > 0:
+                when[group][name] = {"gte": round(float(max(0.0, mean[j, f] - std[j, f])), 2)}
+                tags.append(f"high {name}")
+            else:
+                when[group][name] = {"lte": round(float(min(1.0, mean[j, f] + std[j, f])), 2)}
+                tags.append(f"low {name}")
+        label = ", ".join(tags) or "average profile"
+        out.append({
+            "id": f"CLUSTER_{int(j):02d}",
+            "label": {"en": f"Cluster {int(j)}: {label}", "el": f"Συστάδα {int(j)}: {label}"},
+            "when": when,
+            "signals": {"opportunity": [], "risk": [], "actions": []},
+            "support": int(stats["size"][j]),
+        })
+    return out
+
+def build_report(X: np.ndarray, C: np.ndarray, stats: Dict[str, np.ndarray], archetypes: List[dict]) -> dict:
+    n = max(int(X.shape[0]), 1)
+    size = np.maximum(stats["size"], 1)[:, None]
+    std = np.sqrt(np.maximum(stats["sumsq"] / size - (stats["sum"] / size) ** 2, 0.0))
+    ids = [a.get("id") for a in archetypes] + ["(none)"]
+    clusters = []
+    for j in np.argsort(-stats["size"]):
+        s = int(stats["size"][j])
+        clusters.append({
+            "cluster": int(j),
+            "size": s,
+            "share": round(s / n, 4),
+            "centroid": {f: round(float(C[j, i]), 4) for i, f in enumerate(FEATURES)},
+            "std": {f: round(float(std[j, i]), 4) for i, f in enumerate(FEATURES)},
+            "archetype_overlap": {ids[a]: round(float(stats["arc"][j, a]) / max(s, 1), 4) for a in range(len(ids))},
+        })
+    total_arc = stats["arc"].sum(axis=0)
+    return {
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "rows": int(X.shape[0]),
+        "k": int(C.shape[0]),
+        "features": FEATURES,
+        "inertia": round(float(stats["inertia"]), 4),
+        "archetype_coverage": {ids[a]: round(float(total_arc[a]) / n, 4) for a in range(len(ids))},
+        "clusters": clusters,
+    }
+
+def main():
+    database_url = os.getenv("DATABASE_URL", "").strip()
+    if not database_url:
+        raise RuntimeError("DATABASE_URL is not set")
+
+    t0 = time.perf_counter()
+    X = load_vectors(database_url)
+    if X.shape[0] < DISCOVER_K:
+        raise SystemExit(f"Only {X.shape[0]} consented rows; need at least DISCOVER_K={DISCOVER_K}.")
+    t1 = time.perf_counter()
+    C = minibatch_kmeans(X, DISCOVER_K, DISCOVER_ITERS, DISCOVER_BATCH, DISCOVER_SEED)
+    t2 = time.perf_counter()
+    archetypes = load_archetypes()
+    lo, hi = archetype_bounds(archetypes)
+    stats = assign_and_summarize(X, C, lo, hi)
+    t3 = time.perf_counter()
+    report = build_report(X, C, stats, archetypes)
+
+    print(f"rows={report['rows']} k={report['k']} load={t1 - t0:.1f}s fit={t2 - t1:.1f}s assign={t3 - t2:.1f}s")
+    print("archetype coverage:", json.dumps(report["archetype_coverage"]))
+    for c in report["clusters"]:
+        top = max((kv for kv in c["archetype_overlap"].items()), key=lambda kv: kv[1])
+        centroid = " ".join(f"{f}={v:.2f}" for f, v in c["centroid"].items())
+        print(f"  #{c['cluster']:>2} n={c['size']:>9} ({c['share']:.1%})  {centroid}  top={top[0]}:{top[1]:.0%}")
+
+    if DISCOVER_REPORT:
+        Path(DISCOVER_REPORT).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"Wrote report to {DISCOVER_REPORT}")
+    if DISCOVER_CANDIDATES:
+        doc = {
+            "version": "candidate",
+            "generated_at": report["generated_at"],
+            "archetypes": candidate_rules(stats, X),
+        }
+        Path(DISCOVER_CANDIDATES).write_text(json.dumps(doc, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"Wrote {len(doc['archetypes'])} candidate archetypes to {DISCOVER_CANDIDATES}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""SAVE schema migrations for existing databases.
+
+`Base.metadata.create_all` (run at API startup) only creates missing tables; it
+never alters an existing `save_assessments`. This script applies the additive
+changes idempotently and can be re-run safely.
+
+Steps:
+- Add `schema_version` + `responses_vec` (packed float32 responses).
+- Add the (profile_id, created_at, assessment_id) history index and drop the
+  now-redundant single-column profile_id index (both CONCURRENTLY).
+- Add `updated_at` (change-feed watermark) + index, and the tombstone table.
+  Existing rows get the migration time as `updated_at`, so the first
+  incremental sync after migrating returns every row once.
+- Backfill: pack existing JSONB `responses_norm` into `responses_vec`, keeping
+  only keys outside the layout in `responses_norm`. Runs in keyset batches of
+  MIGRATE_BATCH_SIZE rows, one transaction per batch. Opt-in: runs only with
+  SAVE_RESPONSES_STORAGE=packed or PACK_RESPONSES=1, since API instances still
+  on jsonb storage (e.g. during a rolling deploy) and direct SQL consumers read
+  only `responses_norm`.
+
+Schema-only migrations (the default) are safe to apply before any deploy.
+"""
+
+from __future__ import annotations
+import os
+import sys
+from pathlib import Path
+from sqlalchemy import create_engine, text, bindparam, LargeBinary
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import sessionmaker
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from app.config import RESPONSES_STORAGE  # noqa: E402
+from app.responses_codec import current_schema_version, encode  # noqa: E402
+
+DATABASE_URL = os.getenv("DATABASE_URL", "").strip()
+if not DATABASE_URL:
+    raise RuntimeError("DATABASE_URL is not set")
+
+MIGRATE_BATCH_SIZE = int(os.getenv("MIGRATE_BATCH_SIZE", "2000"))
+PACK_RESPONSES = os.getenv("PACK_RESPONSES", "1" if RESPONSES_STORAGE == "packed" else "0").strip() in ("1", "true", "yes")
+
+DDL = [
+    "ALTER TABLE save_assessments ADD COLUMN IF NOT EXISTS schema_version VARCHAR(64)",
+    "ALTER TABLE save_assessments ADD COLUMN IF NOT EXISTS responses_vec BYTEA",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_save_assessments_profile_history "
+    "ON save_assessments (profile_id, created_at, assessment_id)",
+    "DROP INDEX CONCURRENTLY IF EXISTS ix_save_assessments_profile_id",
+    "ALTER TABLE save_assessments ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT now()",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_save_assessments_changes "
+    "ON save_assessments (updated_at, assessment_id)",
+    """CREATE TABLE IF NOT EXISTS save_assessment_tombstones (
+        assessment_id VARCHAR(36) PRIMARY KEY,
+        deleted_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    )""",
+    "CREATE INDEX IF NOT EXISTS ix_save_assessment_tombstones_changes "
+    "ON save_assessment_tombstones (deleted_at, assessment_id)",
+]
+
+engine = create_engine(DATABASE_URL, pool_pre_ping=True, future=True)
+SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False, future=True)
+
+def apply_ddl():
+    # CONCURRENTLY index builds cannot run inside a transaction block.
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for stmt in DDL:
+            conn.execute(text(stmt))
+    print(f"Applied {len(DDL)} DDL statements.")
+
+def pack_responses():
+    version = current_schema_version()
+    select_q = text("""
+        SELECT assessment_id, responses_norm
+        FROM save_assessments
+        WHERE responses_vec IS NULL
+          AND responses_norm IS NOT NULL
+          AND responses_norm <> '{}'::jsonb
+          AND assessment_id > :after
+        ORDER BY assessment_id
+        LIMIT :n
+        FOR UPDATE
+    """)
+    update_q = text("""
+        UPDATE save_assessments
+        SET schema_version = :version, responses_vec = :vec, responses_norm = :extras
+        WHERE assessment_id = :id
+    """).bindparams(bindparam("vec", type_=LargeBinary), bindparam("extras", type_=JSONB))
+
+    # FOR UPDATE: rows stay locked from read to write within the batch
+    # transaction. A concurrent cleanup.py anonymization either commits first
+    # (the row is re-checked and no longer matches) or waits for the batch, so
+    # stale answers are never written back over an anonymized row.
+    after = ""
+    total = 0
+    while True:
+        with SessionLocal() as db:
+            rows = db.execute(select_q, {"after": after, "n": MIGRATE_BATCH_SIZE}).all()
+            if not rows:
+                break
+            params = []
+            for assessment_id, responses_norm in rows:
+                vec, extras = encode(responses_norm, version)
+                params.append({"id": assessment_id, "version": version, "vec": vec, "extras": extras})
+            db.execute(update_q, params)
+            db.commit()
+        after = rows[-1][0]
+        total += len(rows)
+        print(f"Packed {total} rows...")
+    print(f"Packed responses_norm for {total} records (schema_version={version}).")
+
+def main():
+    apply_ddl()
+    if PACK_RESPONSES:
+        pack_responses()
+
+if __name__ == "__main__":
+    main()
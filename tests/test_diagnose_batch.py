@@ -0,0 +1,49 @@
+"""Parity check: `diagnose_batch` re-implements the scoring rules of `diagnose`
+in vectorized form, so both must agree on random partial questionnaires."""
+
+from __future__ import annotations
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from app.config import CAPS  # noqa: E402
+from app.responses_codec import current_schema_version, layout_for  # noqa: E402
+from app.save_engine import diagnose, diagnose_batch, normalize_responses  # noqa: E402
+
+METAS = [
+    {},
+    {"sector": "CCS", "employment": "Self-employed/Freelance"},
+    {"sector": "Creative industries", "profession": "Founder"},
+    {"sector": "Health", "profession": "nurse"},
+]
+
+
+def _random_case(rng: np.random.Generator, keys: list[str]):
+    answered = rng.random(len(keys)) < rng.uniform(0.1, 0.9)
+    responses = {k: int(rng.integers(0, 6)) for k, a in zip(keys, answered) if a}
+    return METAS[int(rng.integers(len(METAS)))], responses
+
+
+def test_diagnose_batch_matches_diagnose():
+    keys = list(layout_for(current_schema_version()))
+    rng = np.random.default_rng(20260208)
+    for _ in range(300):
+        meta, responses = _random_case(rng, keys)
+        expected = diagnose(meta, responses)
+        normed = normalize_responses(responses)
+        X = np.array([[normed.get(k, np.nan) for k in keys]])
+        out = diagnose_batch(meta, keys, X)
+
+        assert np.isclose(out["save_score"][0], expected["save_score"], atol=1e-6)
+        assert np.isclose(out["V"][0], expected["risk"]["V"], atol=1e-6)
+        assert np.allclose(out["capital_vector"][0], [expected["capital_vector"][c] for c in CAPS], atol=1e-6)
+
+        # Bottleneck ranking: same cells, same order, same priorities.
+        T, pri = out["T"][0], out["priority"][0]
+        cells = [(i, j) for i in range(5) for j in range(5) if i != j and T[i, j] > 0]
+        cells.sort(key=lambda c: pri[c], reverse=True)
+        got = [(CAPS[i], CAPS[j], pri[i, j]) for i, j in cells[:5]]
+        assert [(a, b) for a, b, _ in got] == [(b["from"], b["to"]) for b in expected["bottlenecks"]]
+        assert np.allclose([p for _, _, p in got], [b["priority"] for b in expected["bottlenecks"]])